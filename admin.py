@@ -2,36 +2,83 @@
 Admin functionality for the bot
 """
 
+import asyncio
 import os
-import shutil
+from bot import bulk_import, storage
 from bot.config import Config
-from bot.database import Database
+from bot.async_database import AsyncDatabase
 from bot.language import language_manager
+from bot.metrics import metrics
 
 class AdminManager:
     def __init__(self):
-        self.db = Database()
+        self.db = AsyncDatabase()
         Config.ensure_movies_dir()
     
     def is_admin(self, user_id):
         """Check if user is admin"""
         return Config.is_admin(user_id)
     
-    def save_movie_file(self, file_path, code, original_filename):
-        """Save movie file to movies directory"""
+    async def stage_upload(self, file_obj):
+        """Download an uploaded movie into a staging file in the movies directory.
+        
+        The file is hashed while it is written; disk work runs off the event
+        loop. Returns (staging_path, file_size, sha256).
+        """
         try:
-            # Create filename with code
-            file_extension = os.path.splitext(original_filename)[1]
-            new_filename = f"{code}{file_extension}"
-            destination = os.path.join(Config.MOVIES_DIR, new_filename)
-            
-            # Copy file to movies directory
-            shutil.move(file_path, destination)
-            
-            return destination, new_filename
+            data = await file_obj.download_as_bytearray()
+            return await asyncio.to_thread(storage.stage_hashed, storage.iter_chunks(data))
         except Exception as e:
             print(f"Error saving movie file: {e}")
-            return None, None
+            return None, None, None
+    
+    async def add_movie(self, code, title, filename, staging_path, file_size, sha256, uploaded_by,
+                        file_id=None, file_unique_id=None):
+        """Move a staged upload into the blob store and add the movie.
+        
+        Runs on the database thread; the file is moved into place inside the
+        same write-locked transaction that takes its reference.
+        """
+        return await self.db.run(
+            self._add_movie_blocking, code, title, filename, staging_path, file_size, sha256,
+            uploaded_by, file_id, file_unique_id
+        )
+    
+    def _add_movie_blocking(self, code, title, filename, staging_path, file_size, sha256,
+                            uploaded_by, file_id, file_unique_id):
+        success = self.db.db.add_movie(
+            code, title, filename, storage.blob_path(sha256), file_size, uploaded_by,
+            file_id=file_id, file_unique_id=file_unique_id, sha256=sha256,
+            store_file=lambda: storage.commit_blob(staging_path, sha256)
+        )
+        if not success:
+            storage.discard(staging_path)
+        return success
+    
+    async def remove_movie(self, movie):
+        """Remove a movie, deleting its file once no other code uses it"""
+        return await self.db.run(self._remove_movie_blocking, movie)
+    
+    def _remove_movie_blocking(self, movie):
+        if not self.db.db.remove_movie(movie[1]):
+            return False
+        
+        if movie[11]:  # sha256 is at index 11
+            self._release_blob(movie[11])
+        elif not self.db.db.is_file_referenced(movie[4]):
+            # Stored before the blob store; owned by this code alone
+            self.delete_movie_file(movie[4])
+        return True
+    
+    def _release_blob(self, sha256):
+        self.db.db.release_blob(sha256, remove_file=self.delete_movie_file)
+    
+    async def import_manifest(self, manifest_path, uploaded_by):
+        """Bulk-import a manifest: stage files in a worker pool, then
+        insert everything in one transaction on the database thread"""
+        entries = await asyncio.to_thread(bulk_import.read_manifest, manifest_path)
+        report, staged = await asyncio.to_thread(bulk_import.prepare_import, entries)
+        return await self.db.run(bulk_import.commit_import, self.db.db, report, staged, uploaded_by)
     
     def delete_movie_file(self, file_path):
         """Delete movie file from storage"""
@@ -68,9 +115,9 @@ class AdminManager:
         
         return InlineKeyboardMarkup(keyboard)
     
-    def format_stats(self, language_code):
+    async def format_stats(self, language_code):
         """Format bot statistics"""
-        stats = self.db.get_stats()
+        stats = await self.db.get_stats()
         
         return language_manager.get_text('stats_message', language_code,
             total_users=stats['total_users'],
@@ -79,20 +126,69 @@ class AdminManager:
             total_downloads=stats['total_downloads']
         )
     
-    def format_movies_list(self, language_code):
-        """Format movies list for admin"""
-        movies = self.db.list_movies()
+    def format_perf(self, language_code, limit=25):
+        """Format live latency quantiles, busiest series first"""
+        rows = metrics.latency_summary(limit)
+        
+        if not rows:
+            return language_manager.get_text('perf_empty', language_code)
         
-        if not movies:
-            return language_manager.get_text('no_movies', language_code)
+        message = language_manager.get_text('perf_header', language_code) + "\n\n"
+        for series, count, p50, p95, p99 in rows:
+            message += f"{series}\n"
+            message += f"  n={count} p50={p50 * 1000:.1f}ms p95={p95 * 1000:.1f}ms p99={p99 * 1000:.1f}ms\n"
+        
+        return message
+    
+    async def format_cache_stats(self, language_code):
+        """Format cache sizes and hit rates"""
+        caches = await self.db.cache_stats()
+        
+        message = language_manager.get_text('cache_stats_header', language_code) + "\n\n"
+        for name, stats in caches.items():
+            message += language_manager.get_text('cache_stats_line', language_code, name=name, **stats) + "\n"
+        
+        return message
+    
+    async def format_movies_list(self, language_code, after_id=None, before_id=None):
+        """Format one page of the movies list with navigation buttons.
+        
+        Buttons carry movie ids rather than codes, which have no length limit
+        and could push callback_data past Telegram's 64 bytes.
+        """
+        from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+        
+        movies, has_previous, has_next = await self.db.list_movies_page(after_id, before_id)
+        
+        if not movies and not has_previous:
+            return language_manager.get_text('no_movies', language_code), None
         
         message = language_manager.get_text('movies_list_header', language_code) + "\n\n"
         
-        for code, title, download_count in movies:
+        for _, code, title, download_count in movies:
             message += f"🎬 {code}: {title}\n"
             message += f"📥 {language_manager.get_text('downloads', language_code)}: {download_count}\n\n"
         
-        return message
+        buttons = []
+        if has_previous and movies:
+            buttons.append(InlineKeyboardButton(
+                language_manager.get_text('previous_page', language_code),
+                callback_data=f'admin_movies_before:{movies[0][0]}'
+            ))
+        elif has_previous:
+            # Past the end (movies removed meanwhile): step back from the last movie seen
+            buttons.append(InlineKeyboardButton(
+                language_manager.get_text('previous_page', language_code),
+                callback_data=f'admin_movies_before:{after_id}'
+            ))
+        if has_next:
+            buttons.append(InlineKeyboardButton(
+                language_manager.get_text('next_page', language_code),
+                callback_data=f'admin_movies_after:{movies[-1][0]}'
+            ))
+        
+        keyboard = InlineKeyboardMarkup([buttons]) if buttons else None
+        return message, keyboard
 
 # Global admin manager instance
 admin_manager = AdminManager()
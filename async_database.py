@@ -0,0 +1,111 @@
+"""
+Asynchronous access to the bot database
+"""
+
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from bot.cache import MISSING
+from bot.config import Config
+from bot.database import Database
+from bot.metrics import metrics
+from bot.prefix_index import normalize
+
+class AsyncDatabase:
+    """Awaitable wrapper around Database.
+    
+    Every call is queued to one dedicated thread, so SQLite reads, writes
+    and fsyncs never block the event loop and statements still run one at
+    a time on the shared connection.
+    """
+    
+    def __init__(self, db=None):
+        self.db = db or Database()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='database')
+        self._methods = {}
+        self._sync_task = None
+    
+    async def run(self, func, *args, **kwargs):
+        """Run a blocking callable on the database thread"""
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+        finally:
+            metrics.observe('bot_db_duration_seconds', time.perf_counter() - start, method=func.__name__)
+    
+    def __getattr__(self, name):
+        """Expose each Database method as a coroutine function of the same name"""
+        if name in self._methods:
+            return self._methods[name]
+        
+        attr = getattr(self.db, name)
+        if not callable(attr):
+            return attr
+        
+        @functools.wraps(attr)
+        async def method(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+        
+        self._methods[name] = method
+        return method
+    
+    async def get_user(self, user_id):
+        """Cached profiles are returned without a trip to the database thread"""
+        user = self.db.user_cache.get(user_id)
+        if user is MISSING:
+            user = await self.run(self.db.load_user, user_id)
+        return user
+    
+    async def get_movie(self, code):
+        """Cached movies and known-missing codes are answered on the event loop"""
+        movie = self.db.cached_movie(code)
+        if movie is MISSING:
+            movie = await self.run(self.db.load_movie, code)
+        return movie
+    
+    async def search_movies(self, query, limit=None):
+        """Repeated searches are answered from the cache on the event loop"""
+        normalized = self.db.normalize_search_query(query)
+        results = self.db.search_cache.get(normalized)
+        if results is MISSING:
+            results = await self.run(self.db.load_search, normalized, limit)
+        return results
+    
+    async def inline_search(self, query, limit=None):
+        """Queries typed again within the TTL are answered on the event loop"""
+        normalized = normalize(query)
+        results = self.db.inline_cache.get(normalized)
+        if results is MISSING:
+            results = await self.run(self.db.load_inline_search, normalized, limit)
+        return results
+    
+    async def _sync_periodically(self):
+        last_purge = None
+        while True:
+            await asyncio.sleep(Config.CACHE_SYNC_INTERVAL)
+            try:
+                await self.run(self.db.sync_caches)
+                if last_purge is None or time.monotonic() - last_purge >= Config.SHARED_STATE_PURGE_INTERVAL:
+                    await self.run(self.db.purge_shared_state)
+                    last_purge = time.monotonic()
+            except Exception as e:
+                print(f"Error syncing shared database state: {e}")
+    
+    def start_cache_sync(self):
+        """Follow changes other bot processes make to the shared database"""
+        if self._sync_task is None:
+            self._sync_task = asyncio.create_task(self._sync_periodically())
+    
+    async def close(self):
+        """Close the connection and stop the database thread"""
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+            try:
+                await self._sync_task
+            except asyncio.CancelledError:
+                pass
+            self._sync_task = None
+        await self.run(self.db.close)
+        self._executor.shutdown(wait=True)
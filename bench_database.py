@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: shared WAL connection vs. a new connection per call
+
+Run with: python -m bot.bench_database [iterations]
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from bot.config import Config
+from bot.database import Database
+
+class ConnectPerCallDatabase:
+    """The previous behaviour: open and close a connection for every statement"""
+    
+    def __init__(self, db_path):
+        self.db_path = db_path
+    
+    def load_user(self, user_id):
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
+            return cursor.fetchone()
+    
+    def load_movie(self, code):
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM movies WHERE code = ?', (code,))
+            return cursor.fetchone()
+    
+    def add_download_record(self, user_id, movie_code):
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                'INSERT INTO downloads (user_id, movie_code) VALUES (?, ?)',
+                (user_id, movie_code)
+            )
+            conn.commit()
+
+def measure(label, func, iterations):
+    """Run func iterations times and print ops/sec"""
+    start = time.perf_counter()
+    for i in range(iterations):
+        func(i)
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<22} {iterations / elapsed:>12,.0f} ops/sec")
+    return iterations / elapsed
+
+def run(iterations):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        Config.DATABASE_PATH = os.path.join(tmp_dir, 'bench.db')
+        pooled = Database()
+        legacy = ConnectPerCallDatabase(Config.DATABASE_PATH)
+        
+        for user_id in range(100):
+            pooled.add_user(user_id, f"user{user_id}")
+        for code in range(100):
+            pooled.add_movie(str(code), f"Movie {code}", f"{code}.mp4", f"movies/{code}.mp4", 0, 0)
+        
+        # load_* bypass the LRU caches, so every call reaches SQLite
+        workloads = [
+            ('load_user', lambda db: lambda i: db.load_user(i % 100)),
+            ('load_movie', lambda db: lambda i: db.load_movie(str(i % 100))),
+            ('add_download_record', lambda db: lambda i: db.add_download_record(i % 100, str(i % 100))),
+        ]
+        
+        for name, workload in workloads:
+            print(f"{name}:")
+            before = measure('connect-per-call', workload(legacy), iterations)
+            after = measure('shared connection', workload(pooled), iterations)
+            print(f"  speedup                {after / before:>12.1f}x")
+        
+        pooled.close()
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
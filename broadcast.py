@@ -0,0 +1,180 @@
+"""
+Rate-limited, resumable broadcasts to all users
+"""
+
+import asyncio
+from telegram.error import Forbidden, RetryAfter, TelegramError
+from bot.config import Config
+from bot.database import WORKER_ID
+from bot.language import language_manager
+from bot.metrics import metrics
+from bot.ratelimit import TokenBucket
+
+class Broadcaster:
+    """Sends admin broadcasts through one token bucket shared by all of them.
+    
+    Progress is saved after every batch of recipients, so a broadcast that
+    was interrupted resumes after the last finished batch once it is claimed.
+    Each recipient gets one message, which keeps well under the per-chat limit.
+    A broadcast is leased to the process sending it, so when several bot
+    processes share the database only one of them sends it.
+    """
+    
+    def __init__(self, bot, db):
+        # The application's bot, so broadcasts share its HTTP connection pool
+        self.bot = bot
+        self.db = db
+        self.bucket = TokenBucket(Config.BROADCAST_RATE, Config.BROADCAST_RATE)
+        self._tasks = {}  # broadcast id -> task
+        self._claim_task = None
+    
+    async def start(self, created_by, text=None, from_chat_id=None, message_id=None):
+        """Create a broadcast of text, or of a copy of a message, and start sending it"""
+        broadcast = await self.db.create_broadcast(created_by, WORKER_ID, text, from_chat_id, message_id)
+        self._spawn(broadcast)
+        return broadcast
+    
+    async def resume(self):
+        """Continue broadcasts whose process stopped or died, and renew our own leases"""
+        for broadcast in await self.db.claim_broadcasts(WORKER_ID):
+            if broadcast[0] not in self._tasks:
+                print(f"Resuming broadcast {broadcast[0]} after user {broadcast[6]}")
+                self._spawn(broadcast)
+    
+    async def _claim_periodically(self):
+        while True:
+            try:
+                await self.resume()
+            except Exception as e:
+                print(f"Error claiming broadcasts: {e}")
+            await asyncio.sleep(Config.BROADCAST_CLAIM_INTERVAL)
+    
+    def start_claiming(self):
+        """Resume interrupted broadcasts now and keep checking for orphaned ones"""
+        if self._claim_task is None:
+            self._claim_task = asyncio.create_task(self._claim_periodically())
+    
+    async def cancel(self, broadcast_id):
+        """Stop a running broadcast for good; returns False if it was not running"""
+        cancelled = await self.db.finish_broadcast(broadcast_id, 'cancelled')
+        task = self._tasks.get(broadcast_id)
+        if task is not None:
+            task.cancel()
+        return cancelled
+    
+    async def stop(self):
+        """Cancel the send tasks and give up their leases.
+        
+        Running broadcasts are resumed by the next process that claims them,
+        including this one after a restart.
+        """
+        tasks = list(self._tasks.values())
+        if self._claim_task is not None:
+            tasks.append(self._claim_task)
+            self._claim_task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.db.release_broadcasts(WORKER_ID)
+    
+    def _spawn(self, broadcast):
+        broadcast_id = broadcast[0]
+        if broadcast_id in self._tasks:
+            return
+        task = asyncio.create_task(self._run(broadcast))
+        self._tasks[broadcast_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(broadcast_id, None))
+    
+    async def _run(self, broadcast):
+        broadcast_id = broadcast[0]
+        delay = Config.BROADCAST_RETRY_DELAY
+        
+        while True:
+            try:
+                await self._send_all(broadcast_id)
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # e.g. the database stayed locked; continue from the saved cursor
+                print(f"Error in broadcast {broadcast_id}, retrying in {delay:g}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, Config.BROADCAST_RETRY_MAX_DELAY)
+    
+    async def _send_all(self, broadcast_id):
+        """Send to every remaining recipient, starting after the saved cursor"""
+        broadcast = await self.db.get_broadcast(broadcast_id)
+        # Stop if it was cancelled or another process took it over meanwhile
+        if broadcast[5] != 'running' or broadcast[12] != WORKER_ID:
+            return
+        after_user_id = broadcast[6]  # last_user_id is at index 6
+        
+        while True:
+            user_ids = await self.db.get_broadcast_recipients(after_user_id, Config.BROADCAST_BATCH_SIZE)
+            if not user_ids:
+                break
+            
+            results = await asyncio.gather(*(self._send(broadcast, user_id) for user_id in user_ids))
+            sent = results.count('sent')
+            blocked = [user_id for user_id, result in zip(user_ids, results) if result == 'blocked']
+            failed = len(results) - sent - len(blocked)
+            
+            if not await self.db.save_broadcast_progress(broadcast_id, WORKER_ID, user_ids[-1],
+                                                         sent, failed, blocked):
+                # Cancelled, possibly from another process
+                return
+            after_user_id = user_ids[-1]
+        
+        if await self.db.finish_broadcast(broadcast_id, 'done'):
+            await self._report(broadcast_id)
+    
+    async def _send(self, broadcast, user_id):
+        """Deliver to one user; returns 'sent', 'blocked' or 'failed'"""
+        text, from_chat_id, message_id = broadcast[2], broadcast[3], broadcast[4]
+        
+        for _ in range(Config.BROADCAST_MAX_RETRIES + 1):
+            await self.bucket.acquire()
+            try:
+                if text is not None:
+                    await self.bot.send_message(chat_id=user_id, text=text)
+                else:
+                    await self.bot.copy_message(chat_id=user_id, from_chat_id=from_chat_id, message_id=message_id)
+                metrics.inc('bot_broadcast_messages_total', result='sent')
+                return 'sent'
+            except RetryAfter as e:
+                # Flood control applies to the whole bot, so every send waits it out
+                self.bucket.pause(e.retry_after)
+            except Forbidden:
+                metrics.inc('bot_broadcast_messages_total', result='blocked')
+                return 'blocked'
+            except TelegramError as e:
+                print(f"Broadcast to {user_id} failed: {e}")
+                break
+        
+        metrics.inc('bot_broadcast_messages_total', result='failed')
+        return 'failed'
+    
+    async def _report(self, broadcast_id):
+        """Tell the admin who started a broadcast that it finished"""
+        broadcast = await self.db.get_broadcast(broadcast_id)
+        admin_id = broadcast[1]
+        if not admin_id:
+            return
+        
+        user_data = await self.db.get_user(admin_id)
+        language_code = user_data[4] if user_data else Config.DEFAULT_LANGUAGE
+        try:
+            await self.bot.send_message(chat_id=admin_id, text=format_broadcast(broadcast, language_code))
+        except TelegramError as e:
+            print(f"Error reporting broadcast {broadcast_id}: {e}")
+
+def format_broadcast(broadcast, language_code):
+    """Status text of a broadcast row"""
+    return language_manager.get_text(
+        'broadcast_status', language_code,
+        id=broadcast[0],
+        status=language_manager.get_text(f'broadcast_{broadcast[5]}', language_code),
+        sent=broadcast[7],
+        failed=broadcast[8],
+        blocked=broadcast[9]
+    )
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Bulk catalogue import from a CSV or JSON manifest
+
+A manifest lists code, title and path for each movie: a CSV file with
+those column headers, or a JSON array of objects with those keys.
+Relative paths are resolved against the manifest's directory.
+
+Files are validated and hashed into the blob store by a worker pool,
+then every new movie is inserted in a single transaction.
+
+Usage: python -m bot.bulk_import manifest.csv [--uploaded-by ID] [--workers N]
+"""
+
+import argparse
+import csv
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from bot import storage
+from bot.config import Config
+
+class ImportReport:
+    """Outcome of an import, by category of code"""
+    
+    def __init__(self):
+        self.imported = []
+        self.duplicate_in_manifest = []
+        self.already_exists = []
+        self.missing_files = []
+        self.too_large = []
+        self.invalid = []
+        self.errors = []
+    
+    def summary(self, limit=20):
+        """Category -> count and the first codes, for messages"""
+        def sample(codes):
+            shown = ', '.join(str(code) for code in codes[:limit])
+            return shown + (', ...' if len(codes) > limit else '')
+        
+        return {
+            'imported': len(self.imported),
+            'duplicate_in_manifest': sample(self.duplicate_in_manifest) or '-',
+            'already_exists': sample(self.already_exists) or '-',
+            'missing_files': sample(self.missing_files) or '-',
+            'too_large': sample(self.too_large) or '-',
+            'invalid': sample(self.invalid) or '-',
+            'errors': sample(self.errors) or '-'
+        }
+
+def read_manifest(manifest_path):
+    """Manifest entries as dicts with code, title and path"""
+    with open(manifest_path, 'r', encoding='utf-8', newline='') as manifest:
+        if manifest_path.lower().endswith('.json'):
+            entries = json.load(manifest)
+            if not isinstance(entries, list) or not all(isinstance(entry, dict) for entry in entries):
+                raise ValueError("JSON manifest must be an array of objects with code, title and path")
+        else:
+            entries = list(csv.DictReader(manifest))
+    
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    for entry in entries:
+        path = (entry.get('path') or '').strip()
+        if path and not os.path.isabs(path):
+            entry['path'] = os.path.join(base_dir, path)
+    return entries
+
+def _stage_entry(entry):
+    """Worker: validate one file and copy it to staging while hashing"""
+    path = entry['path']
+    if not os.path.isfile(path):
+        return entry, 'missing', None
+    if os.path.getsize(path) > Config.MAX_FILE_SIZE:
+        return entry, 'too_large', None
+    try:
+        return entry, 'ok', storage.stage_hashed(storage.iter_file_chunks(path))
+    except OSError as e:
+        print(f"Error staging {path}: {e}")
+        return entry, 'error', None
+
+def prepare_import(entries, workers=None):
+    """Validate entries and stage their files in parallel.
+    
+    Returns (report, staged) where staged is a list of
+    (entry, (staging_path, file_size, sha256)).
+    """
+    report = ImportReport()
+    seen_codes = set()
+    candidates = []
+    
+    for entry in entries:
+        code = str(entry.get('code') or '').strip()
+        title = str(entry.get('title') or '').strip()
+        if not code or not title or not entry.get('path'):
+            report.invalid.append(code or '?')
+            continue
+        if code in seen_codes:
+            report.duplicate_in_manifest.append(code)
+            continue
+        seen_codes.add(code)
+        candidates.append({'code': code, 'title': title, 'path': entry['path']})
+    
+    staged = []
+    with ThreadPoolExecutor(max_workers=workers or Config.IMPORT_WORKERS) as pool:
+        for entry, status, result in pool.map(_stage_entry, candidates):
+            if status == 'ok':
+                staged.append((entry, result))
+            elif status == 'missing':
+                report.missing_files.append(entry['code'])
+            elif status == 'too_large':
+                report.too_large.append(entry['code'])
+            else:
+                report.errors.append(entry['code'])
+    
+    return report, staged
+
+def commit_import(db, report, staged, uploaded_by):
+    """Insert all movies in one transaction, moving their staged files into the blob store.
+    
+    Blocking; in the bot it runs on the database thread.
+    """
+    rows = []
+    staging_paths = {}
+    for entry, (staging_path, file_size, sha256) in staged:
+        filename = entry['code'] + os.path.splitext(entry['path'])[1]
+        rows.append((entry['code'], entry['title'], filename, storage.blob_path(sha256),
+                     file_size, uploaded_by, sha256))
+        staging_paths[entry['code']] = staging_path
+    
+    # Files of inserted rows move into the blob store under the write lock
+    inserted, existing = db.add_movies_bulk(
+        rows, store_file=lambda movie: storage.commit_blob(staging_paths[movie[0]], movie[6])
+    )
+    report.imported.extend(inserted)
+    report.already_exists.extend(existing)
+    
+    for code in existing:
+        storage.discard(staging_paths[code])
+    
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Import movies from a CSV/JSON manifest")
+    parser.add_argument('manifest', help="CSV (code,title,path columns) or JSON manifest")
+    parser.add_argument('--uploaded-by', type=int, default=0, help="admin user id recorded as uploader")
+    parser.add_argument('--workers', type=int, default=None, help="hashing worker threads")
+    args = parser.parse_args()
+    
+    from bot.database import Database
+    Config.ensure_movies_dir()
+    
+    report, staged = prepare_import(read_manifest(args.manifest), args.workers)
+    commit_import(Database(), report, staged, args.uploaded_by)
+    
+    for category, value in report.summary().items():
+        print(f"{category}: {value}")
+
+if __name__ == '__main__':
+    main()
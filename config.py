@@ -13,12 +13,97 @@ class Config:
     # Admin user IDs (comma-separated in environment variable)
     ADMIN_IDS = [int(x.strip()) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip()]
     
+    # Run mode: "polling", or "webhook" served by the built-in async web server
+    RUN_MODE = os.getenv("RUN_MODE", "polling")
+    WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # public base URL; empty skips set_webhook
+    WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+    WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+    WEB_HOST = os.getenv("WEB_HOST", "0.0.0.0")
+    WEB_PORT = int(os.getenv("PORT", "8080"))
+    
+    # Updates processed at once; 0 or 1 processes them sequentially.
+    # Each user's updates are always handled in order.
+    CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "16"))
+    
+    # Outbound Bot API connection pool, shared by every outgoing call
+    CONNECTION_POOL_SIZE = int(os.getenv("CONNECTION_POOL_SIZE", "64"))
+    POOL_TIMEOUT = float(os.getenv("POOL_TIMEOUT", "5"))  # seconds to wait for a free connection
+    CONNECT_TIMEOUT = float(os.getenv("CONNECT_TIMEOUT", "5"))
+    READ_TIMEOUT = float(os.getenv("READ_TIMEOUT", "10"))
+    HTTP_VERSION = os.getenv("HTTP_VERSION", "1.1")  # "2" requires python-telegram-bot[http2]
+    
     # Database settings
     DATABASE_PATH = "bot_database.db"
+    DB_BUSY_TIMEOUT = 5.0  # seconds to wait for a locked database
+    DB_CACHE_SIZE_KB = 16 * 1024  # SQLite page cache per connection
+    DB_MMAP_SIZE = 256 * 1024 * 1024  # memory-mapped I/O window
+    DB_CACHED_STATEMENTS = 256  # prepared statements kept per connection
+    
+    # State shared by bot processes using the same database
+    CACHE_SYNC_INTERVAL = float(os.getenv("CACHE_SYNC_INTERVAL", "1"))  # seconds
+    CACHE_INVALIDATION_RETENTION = 3600  # seconds invalidations are kept for slower processes
+    SHARED_STATE_PURGE_INTERVAL = 600  # seconds
+    PENDING_MOVIE_TTL = 3600  # seconds an /add_movie waits for its file
+    
+    # Opt-in statement profiling: time every query, log slow ones with their plan
+    DB_PROFILING = os.getenv("DB_PROFILING", "").lower() in ("1", "true", "yes")
+    DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "50"))
+    DB_EXPLAIN_SLOW_QUERIES = os.getenv("DB_EXPLAIN_SLOW_QUERIES", "true").lower() in ("1", "true", "yes")
+    
+    # In-process caches
+    USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+    USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "600"))  # seconds
+    MOVIE_CACHE_SIZE = int(os.getenv("MOVIE_CACHE_SIZE", "5000"))
+    MISSING_MOVIE_CACHE_SIZE = int(os.getenv("MISSING_MOVIE_CACHE_SIZE", "5000"))
+    MISSING_MOVIE_CACHE_TTL = float(os.getenv("MISSING_MOVIE_CACHE_TTL", "300"))  # seconds
+    SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "5000"))
+    SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "600"))  # seconds
+    
+    # Title search
+    SEARCH_RESULTS_LIMIT = 8
+    
+    # Inline mode (@bot <code or title>)
+    INLINE_RESULTS_LIMIT = 20  # Telegram allows at most 50
+    INLINE_CACHE_SIZE = int(os.getenv("INLINE_CACHE_SIZE", "5000"))
+    INLINE_CACHE_TTL = float(os.getenv("INLINE_CACHE_TTL", "30"))  # seconds
+    INLINE_CLIENT_CACHE_TIME = 60  # seconds Telegram may cache an answer
+    
+    # Channel subscription checks
+    SUBSCRIPTION_CACHE_SIZE = int(os.getenv("SUBSCRIPTION_CACHE_SIZE", "50000"))
+    SUBSCRIPTION_CACHE_TTL = float(os.getenv("SUBSCRIPTION_CACHE_TTL", "3600"))  # seconds
+    SUBSCRIPTION_CHECK_COOLDOWN = float(os.getenv("SUBSCRIPTION_CHECK_COOLDOWN", "15"))  # seconds
+    SUBSCRIPTION_REVERIFY_INTERVAL = float(os.getenv("SUBSCRIPTION_REVERIFY_INTERVAL", "21600"))  # 0 disables
+    SUBSCRIPTION_REVERIFY_BATCH = int(os.getenv("SUBSCRIPTION_REVERIFY_BATCH", "200"))
+    SUBSCRIPTION_REVERIFY_RATE = float(os.getenv("SUBSCRIPTION_REVERIFY_RATE", "5"))  # requests/second
+    
+    # Write-behind buffering of download statistics
+    DOWNLOAD_FLUSH_INTERVAL = float(os.getenv("DOWNLOAD_FLUSH_INTERVAL", "5"))  # seconds
+    DOWNLOAD_FLUSH_BATCH_SIZE = int(os.getenv("DOWNLOAD_FLUSH_BATCH_SIZE", "200"))
+    ACTIVITY_FLUSH_INTERVAL = float(os.getenv("ACTIVITY_FLUSH_INTERVAL", "300"))  # seconds
+    
+    # Broadcasts: Telegram allows about 30 messages per second in total,
+    # so leave headroom for replies to users
+    BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))  # messages per second
+    BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", "100"))
+    BROADCAST_MAX_RETRIES = 3  # per recipient, after RetryAfter
+    BROADCAST_LEASE = 120  # seconds a process owns a broadcast without renewing it
+    BROADCAST_CLAIM_INTERVAL = 30  # seconds between checks for broadcasts to take over
+    BROADCAST_RETRY_DELAY = 5  # seconds before retrying after an error, doubled each time
+    BROADCAST_RETRY_MAX_DELAY = 300
+    
+    # Per-user flood control for code lookups and button presses
+    FLOOD_RATE = float(os.getenv("FLOOD_RATE", "1"))  # requests per second
+    FLOOD_BURST = int(os.getenv("FLOOD_BURST", "5"))
+    FLOOD_DUPLICATE_WINDOW = float(os.getenv("FLOOD_DUPLICATE_WINDOW", "3"))  # seconds
+    FLOOD_IDLE_TTL = 600  # seconds before an idle user's state is dropped
     
     # File storage settings
     MOVIES_DIR = "movies"
     MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB limit
+    IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "4"))  # hashing threads for bulk import
+    
+    # Admin movie list page size
+    MOVIES_PAGE_SIZE = 20
     
     # Language settings
     DEFAULT_LANGUAGE = "uz"
@@ -2,97 +2,216 @@
 Database operations for the bot
 """
 
+import json
 import sqlite3
 import os
+import re
+import socket
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
 from datetime import datetime
+from bot.cache import LRUCache, MISSING
 from bot.config import Config
+from bot.migrations import COUNT_STATS_SQL, migrate
+from bot.prefix_index import PrefixIndex, normalize
+from bot.query_profiler import ProfilingConnection
+
+# Identifies this process in broadcast and job leases
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
 
 class Database:
+    STATS_COUNTERS = ('total_users', 'subscribed_users', 'total_movies', 'total_downloads')
+    
     def __init__(self):
         self.db_path = Config.DATABASE_PATH
+        self._lock = threading.RLock()
+        self.user_cache = LRUCache(Config.USER_CACHE_SIZE, Config.USER_CACHE_TTL)
+        # Cached movie rows may lag behind on download_count, which lookups never use
+        self.movie_cache = LRUCache(Config.MOVIE_CACHE_SIZE)
+        self.missing_movie_cache = LRUCache(Config.MISSING_MOVIE_CACHE_SIZE, Config.MISSING_MOVIE_CACHE_TTL)
+        self.search_cache = LRUCache(Config.SEARCH_CACHE_SIZE, Config.SEARCH_CACHE_TTL)
+        # Inline mode: prefix index rebuilt lazily after catalogue changes,
+        # plus a short-lived cache of answers per query string
+        self.inline_index = None
+        self.inline_cache = LRUCache(Config.INLINE_CACHE_SIZE, Config.INLINE_CACHE_TTL)
+        # Position in cache_invalidations and PRAGMA data_version at the last sync
+        self._invalidation_id = 0
+        self._data_version = None
+        self.conn = self.connect()
         self.init_database()
     
+    def connect(self):
+        """Open the long-lived connection shared by every method"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=Config.DB_BUSY_TIMEOUT,
+            check_same_thread=False,
+            cached_statements=Config.DB_CACHED_STATEMENTS,
+            factory=ProfilingConnection if Config.DB_PROFILING else sqlite3.Connection
+        )
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA cache_size = -{int(Config.DB_CACHE_SIZE_KB)}')
+        conn.execute(f'PRAGMA mmap_size = {int(Config.DB_MMAP_SIZE)}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        # REPLACE must fire delete triggers so the statistics counters stay exact
+        conn.execute('PRAGMA recursive_triggers = ON')
+        return conn
+    
+    @contextmanager
+    def cursor(self, immediate=False):
+        """Cursor on the shared connection; commits on success, rolls back on error.
+        
+        immediate takes the database write lock up front, so check-then-act
+        steps inside the block are serialized with other processes too.
+        """
+        with self._lock, self.conn:
+            cursor = self.conn.cursor()
+            try:
+                if immediate:
+                    cursor.execute('BEGIN IMMEDIATE')
+                yield cursor
+            finally:
+                cursor.close()
+    
+    def close(self):
+        """Close the shared connection"""
+        with self._lock:
+            self.conn.close()
+    
     def init_database(self):
-        """Initialize database tables"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            
-            # Users table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    first_name TEXT,
-                    last_name TEXT,
-                    language_code TEXT DEFAULT 'uz',
-                    is_subscribed BOOLEAN DEFAULT FALSE,
-                    instagram_followed BOOLEAN DEFAULT FALSE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
+        """Apply pending schema migrations"""
+        with self._lock:
+            migrate(self.conn, self.db_path)
+            self._data_version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+            self._invalidation_id = self.conn.execute('SELECT COALESCE(MAX(id), 0) FROM cache_invalidations').fetchone()[0]
+    
+    def sync_caches(self):
+        """Drop cached rows that other processes changed since the last call.
+        
+        PRAGMA data_version only moves when another connection commits,
+        so a process running alone never reads the invalidation log.
+        """
+        with self._lock:
+            data_version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+            if data_version == self._data_version:
+                return 0
+            self._data_version = data_version
             
-            # Movies table
+            rows = self.conn.execute(
+                'SELECT id, kind, key FROM cache_invalidations WHERE id > ? ORDER BY id', (self._invalidation_id,)
+            ).fetchall()
+        
+        for invalidation_id, kind, key in rows:
+            if kind == 'movie':
+                self.invalidate_movie(key)
+            elif kind == 'user':
+                self.user_cache.invalidate(int(key))
+            self._invalidation_id = invalidation_id
+        return len(rows)
+    
+    def purge_shared_state(self):
+        """Delete expired conversation state and invalidations every process has seen"""
+        with self.cursor() as cursor:
+            cursor.execute('DELETE FROM conversation_state WHERE expires_at <= ?', (time.time(),))
+            cursor.execute(
+                "DELETE FROM cache_invalidations WHERE created_at < datetime('now', ?)",
+                (f'-{int(Config.CACHE_INVALIDATION_RETENTION)} seconds',)
+            )
+    
+    def acquire_lease(self, name, worker_id, ttl):
+        """Hold the named job lease for ttl seconds if it is free, expired or already ours"""
+        now = time.time()
+        with self.cursor() as cursor:
             cursor.execute('''
-                CREATE TABLE IF NOT EXISTS movies (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    code TEXT UNIQUE NOT NULL,
-                    title TEXT NOT NULL,
-                    filename TEXT NOT NULL,
-                    file_path TEXT NOT NULL,
-                    file_size INTEGER,
-                    uploaded_by INTEGER,
-                    upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    download_count INTEGER DEFAULT 0
-                )
-            ''')
-            
-            # Download history table
+                INSERT INTO job_leases (name, worker_id, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT (name) DO UPDATE SET worker_id = excluded.worker_id, expires_at = excluded.expires_at
+                WHERE job_leases.worker_id = excluded.worker_id OR job_leases.expires_at < ?
+            ''', (name, worker_id, now + ttl, now))
+            return cursor.rowcount > 0
+    
+    def set_state(self, user_id, key, value, ttl):
+        """Store JSON-serializable conversation state for a user, expiring after ttl seconds"""
+        with self.cursor() as cursor:
             cursor.execute('''
-                CREATE TABLE IF NOT EXISTS downloads (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    movie_code TEXT,
-                    download_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (user_id),
-                    FOREIGN KEY (movie_code) REFERENCES movies (code)
-                )
-            ''')
-            
-            conn.commit()
+                INSERT INTO conversation_state (user_id, key, value, expires_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (user_id, key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at
+            ''', (user_id, key, json.dumps(value), time.time() + ttl))
+    
+    def get_state(self, user_id, key):
+        """Conversation state stored for a user, or None if there is none or it expired"""
+        with self.cursor() as cursor:
+            cursor.execute(
+                'SELECT value FROM conversation_state WHERE user_id = ? AND key = ? AND expires_at > ?',
+                (user_id, key, time.time())
+            )
+            row = cursor.fetchone()
+        return json.loads(row[0]) if row else None
+    
+    def delete_state(self, user_id, key):
+        """Forget a user's conversation state"""
+        with self.cursor() as cursor:
+            cursor.execute('DELETE FROM conversation_state WHERE user_id = ? AND key = ?', (user_id, key))
     
     def add_user(self, user_id, username=None, first_name=None, last_name=None):
-        """Add or update user in database"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        """Add user, or update their name fields if any of them changed.
+        
+        Language, subscription and created_at are left untouched for
+        existing users; last_activity is written by ActivityTracker.
+        """
+        with self.cursor() as cursor:
             cursor.execute('''
-                INSERT OR REPLACE INTO users 
-                (user_id, username, first_name, last_name, last_activity)
-                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                INSERT INTO users (user_id, username, first_name, last_name)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    username = excluded.username,
+                    first_name = excluded.first_name,
+                    last_name = excluded.last_name
+                WHERE username IS NOT excluded.username
+                   OR first_name IS NOT excluded.first_name
+                   OR last_name IS NOT excluded.last_name
             ''', (user_id, username, first_name, last_name))
-            conn.commit()
+            changed = cursor.rowcount > 0
+        if changed:
+            self.user_cache.invalidate(user_id)
     
     def get_user(self, user_id):
-        """Get user from database"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        """Get user, served from the profile cache when possible"""
+        user = self.user_cache.get(user_id)
+        if user is MISSING:
+            user = self.load_user(user_id)
+        return user
+    
+    def load_user(self, user_id):
+        """Read user from database and refresh the profile cache"""
+        with self.cursor() as cursor:
             cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
-            return cursor.fetchone()
+            user = cursor.fetchone()
+        self.user_cache.set(user_id, user)
+        return user
     
     def update_user_language(self, user_id, language_code):
         """Update user's language preference"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        with self.cursor() as cursor:
             cursor.execute(
                 'UPDATE users SET language_code = ? WHERE user_id = ?',
                 (language_code, user_id)
             )
-            conn.commit()
+        self.user_cache.invalidate(user_id)
+    
+    def update_last_activity(self, activity):
+        """Write a batch of (last_activity, user_id) pairs in one transaction.
+        
+        A user who is active again has unblocked the bot.
+        """
+        with self.cursor() as cursor:
+            cursor.executemany('UPDATE users SET last_activity = ?, is_blocked = 0 WHERE user_id = ?', activity)
     
     def update_subscription_status(self, user_id, is_subscribed, instagram_followed=None):
         """Update user's subscription status"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        with self.cursor() as cursor:
             if instagram_followed is not None:
                 cursor.execute(
                     'UPDATE users SET is_subscribed = ?, instagram_followed = ? WHERE user_id = ?',
@@ -103,88 +222,416 @@ class Database:
                     'UPDATE users SET is_subscribed = ? WHERE user_id = ?',
                     (is_subscribed, user_id)
                 )
-            conn.commit()
+        self.user_cache.invalidate(user_id)
     
-    def add_movie(self, code, title, filename, file_path, file_size, uploaded_by):
-        """Add movie to database"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            try:
+    def get_subscribed_user_ids(self, after_user_id=0, limit=200):
+        """Next batch of subscribed user ids after a cursor, in id order"""
+        with self.cursor() as cursor:
+            cursor.execute(
+                'SELECT user_id FROM users WHERE is_subscribed = 1 AND user_id > ? ORDER BY user_id LIMIT ?',
+                (after_user_id, limit)
+            )
+            return [row[0] for row in cursor.fetchall()]
+    
+    def get_broadcast_recipients(self, after_user_id=0, limit=100):
+        """Next batch of user ids that have not blocked the bot, after a cursor"""
+        with self.cursor() as cursor:
+            cursor.execute(
+                'SELECT user_id FROM users WHERE user_id > ? AND is_blocked = 0 ORDER BY user_id LIMIT ?',
+                (after_user_id, limit)
+            )
+            return [row[0] for row in cursor.fetchall()]
+    
+    def create_broadcast(self, created_by, worker_id, text=None, from_chat_id=None, message_id=None):
+        """Record a new running broadcast, leased to worker_id, and return it"""
+        with self.cursor() as cursor:
+            cursor.execute('''
+                INSERT INTO broadcasts (created_by, text, from_chat_id, message_id, worker_id, lease_expires_at)
+                VALUES (?, ?, ?, ?, ?, ?) RETURNING *
+            ''', (created_by, text, from_chat_id, message_id, worker_id, time.time() + Config.BROADCAST_LEASE))
+            return cursor.fetchone()
+    
+    def get_broadcast(self, broadcast_id=None):
+        """Get a broadcast by id, or the most recent one"""
+        with self.cursor() as cursor:
+            if broadcast_id is None:
+                cursor.execute('SELECT * FROM broadcasts ORDER BY id DESC LIMIT 1')
+            else:
+                cursor.execute('SELECT * FROM broadcasts WHERE id = ?', (broadcast_id,))
+            return cursor.fetchone()
+    
+    def claim_broadcasts(self, worker_id):
+        """Take over running broadcasts whose lease ran out, e.g. after a restart"""
+        now = time.time()
+        with self.cursor() as cursor:
+            cursor.execute('''
+                UPDATE broadcasts SET worker_id = ?, lease_expires_at = ?
+                WHERE status = 'running' AND (lease_expires_at IS NULL OR lease_expires_at < ? OR worker_id = ?)
+                RETURNING *
+            ''', (worker_id, now + Config.BROADCAST_LEASE, now, worker_id))
+            return sorted(cursor.fetchall())
+    
+    def release_broadcasts(self, worker_id):
+        """Let other processes claim the running broadcasts held by worker_id right away"""
+        with self.cursor() as cursor:
+            cursor.execute(
+                "UPDATE broadcasts SET lease_expires_at = NULL WHERE worker_id = ? AND status = 'running'",
+                (worker_id,)
+            )
+    
+    def save_broadcast_progress(self, broadcast_id, worker_id, last_user_id, sent, failed, blocked_user_ids):
+        """Advance a broadcast past a batch, renew its lease and mark the users who blocked the bot.
+        
+        Returns False if the broadcast was cancelled or taken over, and should stop.
+        """
+        with self.cursor() as cursor:
+            cursor.executemany('UPDATE users SET is_blocked = 1 WHERE user_id = ?',
+                               [(user_id,) for user_id in blocked_user_ids])
+            cursor.execute('''
+                UPDATE broadcasts SET
+                    last_user_id = ?,
+                    sent_count = sent_count + ?,
+                    failed_count = failed_count + ?,
+                    blocked_count = blocked_count + ?,
+                    lease_expires_at = ?
+                WHERE id = ? AND status = 'running' AND worker_id = ?
+            ''', (last_user_id, sent, failed, len(blocked_user_ids),
+                  time.time() + Config.BROADCAST_LEASE, broadcast_id, worker_id))
+            return cursor.rowcount > 0
+    
+    def finish_broadcast(self, broadcast_id, status):
+        """Mark a running broadcast done or cancelled; returns False if it was not running"""
+        with self.cursor() as cursor:
+            cursor.execute(
+                "UPDATE broadcasts SET status = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ? AND status = 'running'",
+                (status, broadcast_id)
+            )
+            return cursor.rowcount > 0
+    
+    def add_movie(self, code, title, filename, file_path, file_size, uploaded_by,
+                  file_id=None, file_unique_id=None, sha256=None, store_file=None):
+        """Add movie to database.
+        
+        store_file, if given, puts the file in place (e.g. storage.commit_blob)
+        while the write lock is held, before the row becomes visible, so a
+        concurrent release of the same blob cannot delete it in between.
+        """
+        try:
+            with self.cursor(immediate=store_file is not None) as cursor:
+                if sha256:
+                    # Register the blob; the insert trigger below takes the reference
+                    cursor.execute(
+                        'INSERT OR IGNORE INTO blobs (sha256, file_path, file_size) VALUES (?, ?, ?)',
+                        (sha256, file_path, file_size)
+                    )
                 cursor.execute('''
-                    INSERT INTO movies (code, title, filename, file_path, file_size, uploaded_by)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (code, title, filename, file_path, file_size, uploaded_by))
-                conn.commit()
-                return True
-            except sqlite3.IntegrityError:
-                return False  # Code already exists
+                    INSERT INTO movies (code, title, filename, file_path, file_size, uploaded_by,
+                                        file_id, file_unique_id, sha256)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (code, title, filename, file_path, file_size, uploaded_by,
+                      file_id, file_unique_id, sha256))
+                if store_file is not None:
+                    store_file()
+        except sqlite3.IntegrityError:
+            return False  # Code already exists; nothing was written
+        self.invalidate_movie(code)
+        return True
+    
+    def add_movies_bulk(self, movies, store_file=None):
+        """Insert many (code, title, filename, file_path, file_size, uploaded_by, sha256)
+        rows in one transaction, skipping codes that already exist.
+        
+        store_file(movie) is called for every inserted row while the write
+        lock is held, as in add_movie. Returns (inserted_codes, existing_codes).
+        """
+        codes = [movie[0] for movie in movies]
+        existing = set()
+        
+        with self.cursor(immediate=store_file is not None) as cursor:
+            # Stay well under SQLite's bound parameter limit
+            for offset in range(0, len(codes), 500):
+                chunk = codes[offset:offset + 500]
+                cursor.execute(
+                    f"SELECT code FROM movies WHERE code IN ({','.join('?' * len(chunk))})",
+                    chunk
+                )
+                existing.update(row[0] for row in cursor.fetchall())
+            
+            new_movies = [movie for movie in movies if movie[0] not in existing]
+            cursor.executemany(
+                'INSERT OR IGNORE INTO blobs (sha256, file_path, file_size) VALUES (?, ?, ?)',
+                [(sha256, file_path, file_size) for _, _, _, file_path, file_size, _, sha256 in new_movies]
+            )
+            cursor.executemany('''
+                INSERT INTO movies (code, title, filename, file_path, file_size, uploaded_by, sha256)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', new_movies)
+            if store_file is not None:
+                for movie in new_movies:
+                    store_file(movie)
+        
+        inserted = [movie[0] for movie in new_movies]
+        for code in inserted:
+            self.invalidate_movie(code)
+        return inserted, [code for code in codes if code in existing]
     
     def get_movie(self, code):
-        """Get movie by code"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        """Get movie by code, served from the catalogue cache when possible"""
+        movie = self.cached_movie(code)
+        if movie is MISSING:
+            movie = self.load_movie(code)
+        return movie
+    
+    def cached_movie(self, code):
+        """Movie row, None for a known-missing code, or MISSING if not cached"""
+        movie = self.movie_cache.get(code)
+        if movie is MISSING:
+            movie = self.missing_movie_cache.get(code)
+        return movie
+    
+    def load_movie(self, code):
+        """Read movie from database and refresh the catalogue cache"""
+        with self.cursor() as cursor:
             cursor.execute('SELECT * FROM movies WHERE code = ?', (code,))
-            return cursor.fetchone()
+            movie = cursor.fetchone()
+        if movie:
+            self.movie_cache.set(code, movie)
+        else:
+            self.missing_movie_cache.set(code, None)
+        return movie
+    
+    def warm_movie_cache(self):
+        """Load the catalogue into the cache, most downloaded titles first"""
+        with self.cursor() as cursor:
+            cursor.execute('SELECT * FROM movies ORDER BY download_count DESC LIMIT ?',
+                           (Config.MOVIE_CACHE_SIZE,))
+            movies = cursor.fetchall()
+        # Insert least popular first so the hottest titles are the last to be evicted
+        for movie in reversed(movies):
+            self.movie_cache.set(movie[1], movie)
+        return len(movies)
+    
+    def invalidate_movie(self, code):
+        """Forget cached state for a code after it is added, changed or removed"""
+        self.movie_cache.invalidate(code)
+        self.missing_movie_cache.invalidate(code)
+        self.search_cache.clear()
+        self.inline_index = None
+        self.inline_cache.clear()
+    
+    def inline_search(self, query, limit=None):
+        """(code, title, file_id) of sendable movies whose code or title starts with the query"""
+        normalized = normalize(query)
+        results = self.inline_cache.get(normalized)
+        if results is MISSING:
+            results = self.load_inline_search(normalized, limit)
+        return results
+    
+    def load_inline_search(self, normalized, limit=None):
+        """Search the prefix index, rebuilding it first if the catalogue changed"""
+        index = self.inline_index
+        if index is None:
+            with self.cursor() as cursor:
+                cursor.execute('SELECT code, title, file_id FROM movies WHERE file_id IS NOT NULL')
+                index = self.inline_index = PrefixIndex(cursor.fetchall())
+        
+        results = index.search(normalized, limit or Config.INLINE_RESULTS_LIMIT)
+        self.inline_cache.set(normalized, results)
+        return results
+    
+    @staticmethod
+    def normalize_search_query(query):
+        """Lower-cased words of a query; the search cache key"""
+        return ' '.join(re.findall(r'\w+', query.lower()))
+    
+    def search_movies(self, query, limit=None):
+        """Movies whose titles match every word of the query, best match first"""
+        normalized = self.normalize_search_query(query)
+        results = self.search_cache.get(normalized)
+        if results is MISSING:
+            results = self.load_search(normalized, limit)
+        return results
+    
+    def load_search(self, normalized, limit=None):
+        """Run a title search (bm25-ranked) and cache its (code, title) results"""
+        if not normalized:
+            return []
+        
+        # Each word is quoted, so user input cannot inject FTS syntax, and prefix-matched
+        match = ' '.join(f'"{word}"*' for word in normalized.split())
+        with self.cursor() as cursor:
+            cursor.execute('''
+                SELECT movies.code, movies.title
+                FROM movies_fts JOIN movies ON movies.id = movies_fts.rowid
+                WHERE movies_fts MATCH ?
+                ORDER BY bm25(movies_fts)
+                LIMIT ?
+            ''', (match, limit or Config.SEARCH_RESULTS_LIMIT))
+            results = cursor.fetchall()
+        
+        self.search_cache.set(normalized, results)
+        return results
+    
+    def set_movie_file_id(self, code, file_id, file_unique_id=None):
+        """Store the Telegram file id used to resend a movie without re-uploading"""
+        with self.cursor() as cursor:
+            cursor.execute(
+                'UPDATE movies SET file_id = ?, file_unique_id = ? WHERE code = ?',
+                (file_id, file_unique_id, code)
+            )
+        self.invalidate_movie(code)
     
     def remove_movie(self, code):
         """Remove movie from database"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        with self.cursor() as cursor:
             cursor.execute('DELETE FROM movies WHERE code = ?', (code,))
-            conn.commit()
-            return cursor.rowcount > 0
+            removed = cursor.rowcount > 0
+        self.invalidate_movie(code)
+        return removed
+    
+    def release_blob(self, sha256, remove_file=None):
+        """Forget a blob no movie references any more; returns its path, else None.
+        
+        remove_file(path), if given, deletes the file before the delete
+        commits, so no other process can take a new reference in between.
+        """
+        with self.cursor(immediate=remove_file is not None) as cursor:
+            cursor.execute(
+                'DELETE FROM blobs WHERE sha256 = ? AND ref_count <= 0 RETURNING file_path',
+                (sha256,)
+            )
+            row = cursor.fetchone()
+            if row and remove_file is not None:
+                remove_file(row[0])
+        return row[0] if row else None
+    
+    def is_file_referenced(self, file_path):
+        """Whether any movie still points at a file"""
+        with self.cursor() as cursor:
+            cursor.execute('SELECT 1 FROM movies WHERE file_path = ? LIMIT 1', (file_path,))
+            return cursor.fetchone() is not None
+    
+    def list_legacy_movie_files(self):
+        """(id, code, file_path) of every movie, for the one-off blob store migration"""
+        with self.cursor() as cursor:
+            cursor.execute('SELECT id, code, file_path FROM movies ORDER BY id')
+            return cursor.fetchall()
+    
+    def relink_movie_blob(self, movie_id, sha256, file_path, file_size):
+        """Point a movie at a blob, registering the blob if it is new"""
+        with self.cursor() as cursor:
+            cursor.execute(
+                'INSERT OR IGNORE INTO blobs (sha256, file_path, file_size) VALUES (?, ?, ?)',
+                (sha256, file_path, file_size)
+            )
+            cursor.execute('UPDATE blobs SET file_path = ? WHERE sha256 = ?', (file_path, sha256))
+            cursor.execute(
+                'UPDATE movies SET sha256 = ?, file_path = ?, file_size = ? WHERE id = ? RETURNING code',
+                (sha256, file_path, file_size, movie_id)
+            )
+            row = cursor.fetchone()
+        if row:
+            self.invalidate_movie(row[0])
     
     def list_movies(self):
         """List all movies"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        with self.cursor() as cursor:
             cursor.execute('SELECT code, title, download_count FROM movies ORDER BY code')
             return cursor.fetchall()
     
+    def list_movies_page(self, after_id=None, before_id=None, limit=None):
+        """One page of movies ordered by code, using keyset pagination.
+        
+        Pages are keyed by the id of the boundary movie, whose code is looked
+        up in the same query, so callers never pass codes around. Pass
+        after_id for the next page or before_id for the previous one; if that
+        movie was removed meanwhile, the first page is returned.
+        Returns (movies, has_previous, has_next) with (id, code, title, download_count) rows.
+        """
+        limit = limit or Config.MOVIES_PAGE_SIZE
+        with self.cursor() as cursor:
+            if before_id is not None:
+                cursor.execute(
+                    'SELECT id, code, title, download_count FROM movies '
+                    'WHERE code < (SELECT code FROM movies WHERE id = ?) ORDER BY code DESC LIMIT ?',
+                    (before_id, limit + 1)
+                )
+                rows = cursor.fetchall()
+                if rows or self._movie_id_exists(cursor, before_id):
+                    return rows[:limit][::-1], len(rows) > limit, True
+                after_id = before_id = None
+            
+            if after_id is not None:
+                cursor.execute(
+                    'SELECT id, code, title, download_count FROM movies '
+                    'WHERE code > (SELECT code FROM movies WHERE id = ?) ORDER BY code LIMIT ?',
+                    (after_id, limit + 1)
+                )
+                rows = cursor.fetchall()
+                if rows or self._movie_id_exists(cursor, after_id):
+                    return rows[:limit], True, len(rows) > limit
+            
+            cursor.execute(
+                'SELECT id, code, title, download_count FROM movies ORDER BY code LIMIT ?',
+                (limit + 1,)
+            )
+            rows = cursor.fetchall()
+            return rows[:limit], False, len(rows) > limit
+    
+    @staticmethod
+    def _movie_id_exists(cursor, movie_id):
+        cursor.execute('SELECT 1 FROM movies WHERE id = ?', (movie_id,))
+        return cursor.fetchone() is not None
+    
     def increment_download_count(self, code):
         """Increment download count for a movie"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        with self.cursor() as cursor:
             cursor.execute(
                 'UPDATE movies SET download_count = download_count + 1 WHERE code = ?',
                 (code,)
             )
-            conn.commit()
     
     def add_download_record(self, user_id, movie_code):
         """Add download record"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        with self.cursor() as cursor:
             cursor.execute(
                 'INSERT INTO downloads (user_id, movie_code) VALUES (?, ?)',
                 (user_id, movie_code)
             )
-            conn.commit()
+    
+    def record_downloads(self, downloads):
+        """Record a batch of (user_id, movie_code, download_date) downloads in one transaction"""
+        counts = Counter(movie_code for _, movie_code, _ in downloads)
+        with self.cursor() as cursor:
+            cursor.executemany(
+                'INSERT INTO downloads (user_id, movie_code, download_date) VALUES (?, ?, ?)',
+                downloads
+            )
+            cursor.executemany(
+                'UPDATE movies SET download_count = download_count + ? WHERE code = ?',
+                [(count, movie_code) for movie_code, count in counts.items()]
+            )
+    
+    def cache_stats(self):
+        """Hit/miss counters of the in-process caches"""
+        return {
+            'users': self.user_cache.stats(),
+            'movies': self.movie_cache.stats(),
+            'missing_movies': self.missing_movie_cache.stats(),
+            'search': self.search_cache.stats(),
+            'inline': self.inline_cache.stats()
+        }
     
     def get_stats(self):
-        """Get bot statistics"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            
-            # Total users
-            cursor.execute('SELECT COUNT(*) FROM users')
-            total_users = cursor.fetchone()[0]
-            
-            # Subscribed users
-            cursor.execute('SELECT COUNT(*) FROM users WHERE is_subscribed = 1')
-            subscribed_users = cursor.fetchone()[0]
-            
-            # Total movies
-            cursor.execute('SELECT COUNT(*) FROM movies')
-            total_movies = cursor.fetchone()[0]
-            
-            # Total downloads
-            cursor.execute('SELECT COUNT(*) FROM downloads')
-            total_downloads = cursor.fetchone()[0]
-            
-            return {
-                'total_users': total_users,
-                'subscribed_users': subscribed_users,
-                'total_movies': total_movies,
-                'total_downloads': total_downloads
-            }
+        """Get bot statistics from the maintained counters"""
+        with self.cursor() as cursor:
+            cursor.execute('SELECT name, value FROM stats_counters')
+            counters = dict(cursor.fetchall())
+        
+        return {name: counters.get(name, 0) for name in self.STATS_COUNTERS}
+    
+    def reconcile_stats(self):
+        """Rebuild the statistics counters from full table scans"""
+        with self.cursor() as cursor:
+            cursor.execute(COUNT_STATS_SQL)
+        return self.get_stats()
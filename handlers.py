@@ -2,35 +2,86 @@
 Main bot handlers
 """
 
+import asyncio
 import os
-import tempfile
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultCachedDocument
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
 from bot.config import Config
-from bot.database import Database
 from bot.language import language_manager
 from bot.subscription import SubscriptionChecker
 from bot.admin import admin_manager
+from bot.broadcast import Broadcaster, format_broadcast
+from bot.metrics import cache_samples, metrics, timed_handler
+from bot.ratelimit import ALLOW, WARN, FloodControl
+from bot.write_behind import ActivityTracker, DownloadBuffer
 
 class BotHandlers:
     def __init__(self):
-        self.db = Database()
+        self.db = admin_manager.db  # one database thread and connection per process
         self.subscription_checker = None
-        self.pending_movies = {}  # Store pending movie uploads for admins
+        self.broadcaster = None
+        self.uploads = {}  # code -> Future of the file_id from the upload in flight
+        self.flood_control = FloodControl(
+            Config.FLOOD_RATE, Config.FLOOD_BURST, Config.FLOOD_DUPLICATE_WINDOW, Config.FLOOD_IDLE_TTL
+        )
+        self.download_buffer = DownloadBuffer(self.db)
+        self.activity_tracker = ActivityTracker(self.db)
+        metrics.add_collector(self.collect_cache_metrics)
+    
+    def collect_cache_metrics(self):
+        """Cache hit/miss counters for the metrics endpoint"""
+        caches = self.db.db.cache_stats()
+        if self.subscription_checker is not None:
+            caches.update(self.subscription_checker.cache_stats())
+        return cache_samples(caches)
+    
+    async def post_init(self, application):
+        """Warm caches and start background tasks once the application is running"""
+        await self.db.warm_movie_cache()
+        self.db.start_cache_sync()
+        self.download_buffer.start()
+        self.activity_tracker.start()
+        
+        if self.subscription_checker is None:
+            self.subscription_checker = SubscriptionChecker(application.bot)
+        self.subscription_checker.start_reverification(self.db)
+        
+        self.broadcaster = Broadcaster(application.bot, self.db)
+        self.broadcaster.start_claiming()
+    
+    async def post_stop(self, application):
+        """Stop the background jobs that call the Bot API while the bot is still usable"""
+        if self.subscription_checker is not None:
+            await self.subscription_checker.stop_reverification()
+        if self.broadcaster is not None:
+            await self.broadcaster.stop()
+    
+    async def post_shutdown(self, application):
+        """Flush buffered writes and close the database"""
+        await self.download_buffer.stop()
+        await self.activity_tracker.stop()
+        await self.db.close()
     
     def get_subscription_checker(self, context):
         """Get or create subscription checker"""
         if self.subscription_checker is None:
-            self.subscription_checker = SubscriptionChecker(context.bot.token)
+            self.subscription_checker = SubscriptionChecker(context.bot)
         return self.subscription_checker
     
+    async def track_activity(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Record user activity for every update; written in debounced batches"""
+        if update.effective_user:
+            self.activity_tracker.touch(update.effective_user.id)
+    
+    @timed_handler
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /start command"""
         user = update.effective_user
-        self.db.add_user(user.id, user.username, user.first_name, user.last_name)
+        await self.db.add_user(user.id, user.username, user.first_name, user.last_name)
         
         # Get user's language preference
-        user_data = self.db.get_user(user.id)
+        user_data = await self.db.get_user(user.id)
         language_code = user_data[4] if user_data else Config.DEFAULT_LANGUAGE
         
         # Welcome message with subscription request
@@ -42,9 +93,10 @@ class BotHandlers:
         
         await update.message.reply_text(welcome_text, reply_markup=keyboard)
     
+    @timed_handler
     async def language_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show language selection menu"""
-        user_data = self.db.get_user(update.effective_user.id)
+        user_data = await self.db.get_user(update.effective_user.id)
         language_code = user_data[4] if user_data else Config.DEFAULT_LANGUAGE
         
         text = language_manager.get_text('select_language', language_code)
@@ -52,6 +104,7 @@ class BotHandlers:
         
         await update.message.reply_text(text, reply_markup=keyboard)
     
+    @timed_handler
     async def admin_panel(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /admin command"""
         user_id = update.effective_user.id
@@ -59,7 +112,7 @@ class BotHandlers:
         if not admin_manager.is_admin(user_id):
             return
         
-        user_data = self.db.get_user(user_id)
+        user_data = await self.db.get_user(user_id)
         language_code = user_data[4] if user_data else Config.DEFAULT_LANGUAGE
         
         text = language_manager.get_text('admin_panel', language_code)
@@ -67,6 +120,7 @@ class BotHandlers:
         
         await update.message.reply_text(text, reply_markup=keyboard)
     
+    @timed_handler
     async def add_movie(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /add_movie command"""
         user_id = update.effective_user.id
@@ -74,7 +128,7 @@ class BotHandlers:
         if not admin_manager.is_admin(user_id):
             return
         
-        user_data = self.db.get_user(user_id)
+        user_data = await self.db.get_user(user_id)
         language_code = user_data[4] if user_data else Config.DEFAULT_LANGUAGE
         
         if len(context.args) < 2:
@@ -85,12 +139,14 @@ class BotHandlers:
         code = context.args[0]
         title = " ".join(context.args[1:])
         
-        # Store pending movie info
-        self.pending_movies[user_id] = {'code': code, 'title': title}
+        # Store pending movie info; kept in the database so any bot process
+        # can receive the file, even after a restart
+        await self.db.set_state(user_id, 'pending_movie', {'code': code, 'title': title}, Config.PENDING_MOVIE_TTL)
         
         text = language_manager.get_text('send_movie_file', language_code, code=code, title=title)
         await update.message.reply_text(text)
     
+    @timed_handler
     async def remove_movie(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /remove_movie command"""
         user_id = update.effective_user.id
@@ -98,7 +154,7 @@ class BotHandlers:
         if not admin_manager.is_admin(user_id):
             return
         
-        user_data = self.db.get_user(user_id)
+        user_data = await self.db.get_user(user_id)
         language_code = user_data[4] if user_data else Config.DEFAULT_LANGUAGE
         
         if not context.args:
@@ -107,22 +163,50 @@ class BotHandlers:
             return
         
         code = context.args[0]
-        movie = self.db.get_movie(code)
+        movie = await self.db.get_movie(code)
         
         if not movie:
             text = language_manager.get_text('movie_not_found', language_code, code=code)
             await update.message.reply_text(text)
             return
         
-        # Remove from database and delete file
-        if self.db.remove_movie(code):
-            admin_manager.delete_movie_file(movie[4])  # file_path is at index 4
+        # Remove from database and delete the file if no other code uses it
+        if await admin_manager.remove_movie(movie):
             text = language_manager.get_text('movie_removed', language_code, code=code)
         else:
             text = language_manager.get_text('movie_remove_error', language_code)
         
         await update.message.reply_text(text)
     
+    @timed_handler
+    async def import_movies(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /import_movies command"""
+        user_id = update.effective_user.id
+        
+        if not admin_manager.is_admin(user_id):
+            return
+        
+        user_data = await self.db.get_user(user_id)
+        language_code = user_data[4] if user_data else Config.DEFAULT_LANGUAGE
+        
+        if not context.args:
+            text = language_manager.get_text('import_usage', language_code)
+            await update.message.reply_text(text)
+            return
+        
+        manifest_path = " ".join(context.args)
+        try:
+            report = await admin_manager.import_manifest(manifest_path, user_id)
+        except (OSError, ValueError) as e:
+            print(f"Error importing manifest: {e}")
+            text = language_manager.get_text('import_error', language_code, error=e)
+            await update.message.reply_text(text)
+            return
+        
+        text = language_manager.get_text('import_report', language_code, **report.summary())
+        await update.message.reply_text(text)
+    
+    @timed_handler
     async def list_movies(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /list_movies command"""
         user_id = update.effective_user.id
@@ -130,12 +214,13 @@ class BotHandlers:
         if not admin_manager.is_admin(user_id):
             return
         
-        user_data = self.db.get_user(user_id)
+        user_data = await self.db.get_user(user_id)
         language_code = user_data[4] if user_data else Config.DEFAULT_LANGUAGE
         
-        message = admin_manager.format_movies_list(language_code)
-        await update.message.reply_text(message)
+        message, keyboard = await admin_manager.format_movies_list(language_code)
+        await update.message.reply_text(message, reply_markup=keyboard)
     
+    @timed_handler
     async def stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /stats command"""
         user_id = update.effective_user.id
@@ -143,19 +228,142 @@ class BotHandlers:
         if not admin_manager.is_admin(user_id):
             return
         
-        user_data = self.db.get_user(user_id)
+        user_data = await self.db.get_user(user_id)
+        language_code = user_data[4] if user_data else Config.DEFAULT_LANGUAGE
+        
+        message = await admin_manager.format_stats(language_code)
+        await update.message.reply_text(message)
+    
+    @timed_handler
+    async def cache_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /cache_stats command"""
+        user_id = update.effective_user.id
+        
+        if not admin_manager.is_admin(user_id):
+            return
+        
+        user_data = await self.db.get_user(user_id)
         language_code = user_data[4] if user_data else Config.DEFAULT_LANGUAGE
         
-        message = admin_manager.format_stats(language_code)
+        message = await admin_manager.format_cache_stats(language_code)
         await update.message.reply_text(message)
     
+    @timed_handler
+    async def perf(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /perf command"""
+        user_id = update.effective_user.id
+        
+        if not admin_manager.is_admin(user_id):
+            return
+        
+        user_data = await self.db.get_user(user_id)
+        language_code = user_data[4] if user_data else Config.DEFAULT_LANGUAGE
+        
+        message = admin_manager.format_perf(language_code)
+        await update.message.reply_text(message)
+    
+    @timed_handler
+    async def reconcile_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /reconcile_stats command"""
+        user_id = update.effective_user.id
+        
+        if not admin_manager.is_admin(user_id):
+            return
+        
+        user_data = await self.db.get_user(user_id)
+        language_code = user_data[4] if user_data else Config.DEFAULT_LANGUAGE
+        
+        # Flush buffered downloads first so the recount includes them
+        await self.download_buffer.flush()
+        await self.db.reconcile_stats()
+        
+        message = language_manager.get_text('stats_reconciled', language_code) + "\n\n"
+        message += await admin_manager.format_stats(language_code)
+        await update.message.reply_text(message)
+    
+    @timed_handler
+    async def broadcast(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /broadcast command: send text, or a copy of the replied-to message, to every user"""
+        user_id = update.effective_user.id
+        
+        if not admin_manager.is_admin(user_id):
+            return
+        
+        user_data = await self.db.get_user(user_id)
+        language_code = user_data[4] if user_data else Config.DEFAULT_LANGUAGE
+        
+        reply = update.message.reply_to_message
+        if reply is not None:
+            broadcast = await self.broadcaster.start(
+                user_id, from_chat_id=update.effective_chat.id, message_id=reply.message_id
+            )
+        elif context.args:
+            # Everything after the command, with its line breaks
+            text = update.message.text.split(maxsplit=1)[1]
+            broadcast = await self.broadcaster.start(user_id, text=text)
+        else:
+            text = language_manager.get_text('broadcast_usage', language_code)
+            await update.message.reply_text(text)
+            return
+        
+        text = language_manager.get_text('broadcast_started', language_code, id=broadcast[0])
+        await update.message.reply_text(text)
+    
+    @timed_handler
+    async def broadcast_status(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /broadcast_status command"""
+        user_id = update.effective_user.id
+        
+        if not admin_manager.is_admin(user_id):
+            return
+        
+        user_data = await self.db.get_user(user_id)
+        language_code = user_data[4] if user_data else Config.DEFAULT_LANGUAGE
+        
+        broadcast_id = int(context.args[0]) if context.args and context.args[0].isdigit() else None
+        broadcast = await self.db.get_broadcast(broadcast_id)
+        if broadcast is None:
+            text = language_manager.get_text('broadcast_not_found', language_code)
+        else:
+            text = format_broadcast(broadcast, language_code)
+        await update.message.reply_text(text)
+    
+    @timed_handler
+    async def broadcast_cancel(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /broadcast_cancel command"""
+        user_id = update.effective_user.id
+        
+        if not admin_manager.is_admin(user_id):
+            return
+        
+        user_data = await self.db.get_user(user_id)
+        language_code = user_data[4] if user_data else Config.DEFAULT_LANGUAGE
+        
+        broadcast_id = int(context.args[0]) if context.args and context.args[0].isdigit() else None
+        broadcast = await self.db.get_broadcast(broadcast_id)
+        if broadcast is None or not await self.broadcaster.cancel(broadcast[0]):
+            text = language_manager.get_text('broadcast_not_found', language_code)
+        else:
+            text = language_manager.get_text('broadcast_cancel_done', language_code, id=broadcast[0])
+        await update.message.reply_text(text)
+    
+    @timed_handler
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle text messages (movie codes)"""
         user_id = update.effective_user.id
         message_text = update.message.text.strip()
         
+        verdict = self.flood_control.check(user_id, message_text)
+        if verdict != ALLOW:
+            metrics.inc('bot_flood_dropped_total', handler='handle_message')
+            if verdict == WARN:
+                user_data = await self.db.get_user(user_id)
+                language_code = user_data[4] if user_data else Config.DEFAULT_LANGUAGE
+                await update.message.reply_text(language_manager.get_text('flood_warning', language_code))
+            return
+        
         # Get user data
-        user_data = self.db.get_user(user_id)
+        user_data = await self.db.get_user(user_id)
         if not user_data:
             await self.start(update, context)
             return
@@ -165,36 +373,104 @@ class BotHandlers:
         # No subscription check - bot works for everyone
         
         # Try to find movie by code
-        movie = self.db.get_movie(message_text)
+        movie = await self.db.get_movie(message_text)
         
         if movie:
-            # Send movie file
-            try:
-                file_path = movie[4]  # file_path is at index 4
-                
-                if os.path.exists(file_path):
-                    with open(file_path, 'rb') as movie_file:
-                        await update.message.reply_document(
-                            document=movie_file,
-                            filename=movie[3],  # filename is at index 3
-                            caption=language_manager.get_text('movie_sent', language_code, title=movie[2])
-                        )
-                    
-                    # Update download count and add record
-                    self.db.increment_download_count(message_text)
-                    self.db.add_download_record(user_id, message_text)
-                else:
-                    text = language_manager.get_text('movie_file_not_found', language_code)
-                    await update.message.reply_text(text)
-                    
-            except Exception as e:
-                print(f"Error sending movie: {e}")
-                text = language_manager.get_text('movie_send_error', language_code)
-                await update.message.reply_text(text)
+            await self.send_movie(update.message, movie, user_id, language_code)
+            return
+        
+        # Not a code: try it as a title
+        results = await self.db.search_movies(message_text)
+        if results:
+            text = language_manager.get_text('search_results', language_code, query=message_text)
+            await update.message.reply_text(text, reply_markup=self.get_search_keyboard(results))
         else:
             text = language_manager.get_text('invalid_code', language_code, code=message_text)
             await update.message.reply_text(text)
     
+    def get_search_keyboard(self, results):
+        """One button per matching movie; pressing it sends the movie"""
+        keyboard = []
+        for code, title in results:
+            callback_data = f'movie:{code}'
+            # Telegram limits callback data to 64 bytes
+            if len(callback_data.encode('utf-8')) <= 64:
+                keyboard.append([InlineKeyboardButton(f"🎬 {title} ({code})", callback_data=callback_data)])
+        return InlineKeyboardMarkup(keyboard)
+    
+    async def send_movie(self, message, movie, user_id, language_code):
+        """Send a movie, reusing its Telegram file_id when one is cached"""
+        code = movie[1]
+        caption = language_manager.get_text('movie_sent', language_code, title=movie[2])
+        
+        try:
+            sent_message = None
+            
+            # Cached file_id: Telegram resends the file without an upload
+            if movie[9]:  # file_id is at index 9
+                try:
+                    sent_message = await message.reply_document(document=movie[9], caption=caption)
+                except BadRequest as e:
+                    print(f"Cached file_id for movie {code} rejected: {e}")
+            
+            if sent_message is None:
+                sent_message = await self.upload_movie(message, movie, caption)
+                if sent_message is None:
+                    text = language_manager.get_text('movie_file_not_found', language_code)
+                    await message.reply_text(text)
+                    return
+            
+            # Download count and history are written in batches
+            self.download_buffer.add(user_id, code)
+                
+        except Exception as e:
+            print(f"Error sending movie: {e}")
+            text = language_manager.get_text('movie_send_error', language_code)
+            await message.reply_text(text)
+    
+    async def upload_movie(self, message, movie, caption):
+        """Upload a movie that has no usable file_id, once per code.
+        
+        Concurrent requests for the same code wait for the upload in flight
+        and send by its file_id. Returns None if the file is missing.
+        """
+        code = movie[1]
+        
+        while code in self.uploads:
+            file_id = await asyncio.shield(self.uploads[code])
+            if file_id:
+                metrics.inc('bot_uploads_coalesced_total')
+                try:
+                    return await message.reply_document(document=file_id, caption=caption)
+                except BadRequest as e:
+                    print(f"Fresh file_id for movie {code} rejected: {e}")
+        
+        upload = self.uploads[code] = asyncio.get_running_loop().create_future()
+        file_id = None
+        try:
+            file_path = movie[4]  # file_path is at index 4
+            if not os.path.exists(file_path):
+                return None
+            
+            with open(file_path, 'rb') as movie_file:
+                sent_message = await message.reply_document(
+                    document=movie_file,
+                    filename=movie[3],  # filename is at index 3
+                    caption=caption
+                )
+            
+            # Remember the uploaded file so later requests are served by id
+            sent_file = sent_message.document or sent_message.video
+            if sent_file:
+                file_id = sent_file.file_id
+                await self.db.set_movie_file_id(code, sent_file.file_id, sent_file.file_unique_id)
+            return sent_message
+        finally:
+            # Waiters retry on their own when the upload failed
+            del self.uploads[code]
+            upload.set_result(file_id)
+    
+    @timed_handler
     async def handle_file(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle file uploads from admins"""
         user_id = update.effective_user.id
@@ -202,51 +478,51 @@ class BotHandlers:
         if not admin_manager.is_admin(user_id):
             return
         
-        user_data = self.db.get_user(user_id)
+        user_data = await self.db.get_user(user_id)
         language_code = user_data[4] if user_data else Config.DEFAULT_LANGUAGE
         
         # Check if admin has pending movie
-        if user_id not in self.pending_movies:
+        pending_movie = await self.db.get_state(user_id, 'pending_movie')
+        if pending_movie is None:
             text = language_manager.get_text('no_pending_movie', language_code)
             await update.message.reply_text(text)
             return
         
-        pending_movie = self.pending_movies[user_id]
-        
         try:
             # Download file
             file = update.message.document or update.message.video
             file_obj = await context.bot.get_file(file.file_id)
             
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-                await file_obj.download_to_drive(temp_file.name)
-                temp_path = temp_file.name
+            # Stage the file, hashed while it is written
+            staging_path, file_size, sha256 = await admin_manager.stage_upload(file_obj)
             
-            # Save movie file
-            file_path, filename = admin_manager.save_movie_file(
-                temp_path, pending_movie['code'], file.file_name
-            )
-            
-            if file_path:
-                # Add to database
-                success = self.db.add_movie(
+            if staging_path:
+                # Filename users receive; the stored blob is named by its hash
+                file_extension = os.path.splitext(file.file_name or '')[1]
+                filename = f"{pending_movie['code']}{file_extension}"
+                
+                # Add to database. A document's file_id can be resent with
+                # sendDocument straight away; videos get one on first delivery.
+                document = update.message.document
+                success = await admin_manager.add_movie(
                     pending_movie['code'],
                     pending_movie['title'],
                     filename,
-                    file_path,
-                    file.file_size,
-                    user_id
+                    staging_path,
+                    file_size,
+                    sha256,
+                    user_id,
+                    file_id=document.file_id if document else None,
+                    file_unique_id=document.file_unique_id if document else None
                 )
                 
                 if success:
                     text = language_manager.get_text('movie_added', language_code,
                                                      code=pending_movie['code'],
                                                      title=pending_movie['title'])
-                    del self.pending_movies[user_id]
+                    await self.db.delete_state(user_id, 'pending_movie')
                 else:
                     text = language_manager.get_text('movie_code_exists', language_code)
-                    admin_manager.delete_movie_file(file_path)
             else:
                 text = language_manager.get_text('movie_save_error', language_code)
             
@@ -257,23 +533,73 @@ class BotHandlers:
             text = language_manager.get_text('file_upload_error', language_code)
             await update.message.reply_text(text)
     
+    @timed_handler
+    async def inline_query(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Answer @bot <code or title> with movies sent by their Telegram file_id"""
+        inline_query = update.inline_query
+        query_text = inline_query.query.strip()
+        
+        if not query_text:
+            await inline_query.answer([], cache_time=Config.INLINE_CLIENT_CACHE_TIME, is_personal=True)
+            return
+        
+        user_data = await self.db.get_user(inline_query.from_user.id)
+        language_code = user_data[4] if user_data else Config.DEFAULT_LANGUAGE
+        
+        results = [
+            InlineQueryResultCachedDocument(
+                id=code,
+                title=title,
+                document_file_id=file_id,
+                description=language_manager.get_text('inline_movie_code', language_code, code=code),
+                caption=language_manager.get_text('movie_sent', language_code, title=title)
+            )
+            for code, title, file_id in await self.db.inline_search(query_text)
+            # Result ids are limited to 64 bytes
+            if len(code.encode('utf-8')) <= 64
+        ]
+        
+        # Captions are in the user's language, so Telegram must not share the answer
+        await inline_query.answer(results, cache_time=Config.INLINE_CLIENT_CACHE_TIME, is_personal=True)
+    
+    @timed_handler
     async def button_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle button callbacks"""
         query = update.callback_query
-        await query.answer()
-        
         user_id = query.from_user.id
         data = query.data
         
+        # Throttled presses are still answered so the client stops spinning
+        verdict = self.flood_control.check(user_id, data)
+        if verdict != ALLOW:
+            metrics.inc('bot_flood_dropped_total', handler='button_callback')
+            if verdict == WARN:
+                user_data = await self.db.get_user(user_id)
+                language_code = user_data[4] if user_data else Config.DEFAULT_LANGUAGE
+                await query.answer(language_manager.get_text('flood_warning', language_code), show_alert=True)
+            else:
+                await query.answer()
+            return
+        await query.answer()
+        
         # Get user data
-        user_data = self.db.get_user(user_id)
+        user_data = await self.db.get_user(user_id)
         language_code = user_data[4] if user_data else Config.DEFAULT_LANGUAGE
         
+        # Movie chosen from search results
+        if data.startswith('movie:'):
+            movie = await self.db.get_movie(data.split(':', 1)[1])
+            if movie:
+                await self.send_movie(query.message, movie, user_id, language_code)
+            else:
+                text = language_manager.get_text('movie_not_found', language_code, code=data.split(':', 1)[1])
+                await query.message.reply_text(text)
+        
         # Language selection
-        if data.startswith('lang_'):
+        elif data.startswith('lang_'):
             new_language = data.split('_')[1]
             if new_language in Config.SUPPORTED_LANGUAGES:
-                self.db.update_user_language(user_id, new_language)
+                await self.db.update_user_language(user_id, new_language)
                 
                 text = language_manager.get_text('language_changed_with_subscription', new_language)
                 keyboard = self.get_subscription_checker(context).get_subscription_keyboard(new_language)
@@ -286,7 +612,7 @@ class BotHandlers:
             is_subscribed = await checker.check_channel_subscription(user_id)
             
             if is_subscribed:
-                self.db.update_subscription_status(user_id, True)
+                await self.db.update_subscription_status(user_id, True)
                 
                 # Show Instagram follow request
                 text = language_manager.get_text('instagram_follow_request', language_code,
@@ -310,7 +636,7 @@ class BotHandlers:
         
         # Instagram follow confirmation
         elif data == 'instagram_followed':
-            self.db.update_subscription_status(user_id, True, True)
+            await self.db.update_subscription_status(user_id, True, True)
             
             text = language_manager.get_text('setup_complete_soft', language_code)
             try:
@@ -346,11 +672,23 @@ class BotHandlers:
                 await query.edit_message_text(text)
             
             elif data == 'admin_list_movies':
-                message = admin_manager.format_movies_list(language_code)
-                await query.edit_message_text(message)
+                message, keyboard = await admin_manager.format_movies_list(language_code)
+                await query.edit_message_text(message, reply_markup=keyboard)
+            
+            elif data.startswith('admin_movies_after:'):
+                message, keyboard = await admin_manager.format_movies_list(
+                    language_code, after_id=int(data.split(':', 1)[1])
+                )
+                await query.edit_message_text(message, reply_markup=keyboard)
+            
+            elif data.startswith('admin_movies_before:'):
+                message, keyboard = await admin_manager.format_movies_list(
+                    language_code, before_id=int(data.split(':', 1)[1])
+                )
+                await query.edit_message_text(message, reply_markup=keyboard)
             
             elif data == 'admin_stats':
-                message = admin_manager.format_stats(language_code)
+                message = await admin_manager.format_stats(language_code)
                 await query.edit_message_text(message)
             
             elif data == 'admin_close':
@@ -4,10 +4,17 @@ Telegram Movie Bot
 Main entry point for the bot application
 """
 
+import asyncio
 import logging
 import os
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters
+from telegram import Update
+from telegram.ext import (
+    Application, CommandHandler, MessageHandler, CallbackQueryHandler, InlineQueryHandler, TypeHandler, filters
+)
 from bot.handlers import BotHandlers
+from bot.metrics import InstrumentedHTTPXRequest
+from bot.update_processor import PerUserUpdateProcessor
+from bot.webserver import run_webhook
 from bot.config import Config
 
 # Configure logging
@@ -17,6 +24,8 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+ALLOWED_UPDATES = ["message", "callback_query", "inline_query"]
+
 def main():
     """Start the bot."""
     # Get bot token from environment variables
@@ -25,48 +34,70 @@ def main():
         logger.error("BOT_TOKEN environment variable is required")
         return
 
-    # Create the Application
-    application = Application.builder().token(bot_token).build()
-
     # Initialize bot handlers
     bot_handlers = BotHandlers()
 
+    # One tuned, instrumented connection pool for every outbound Bot API call
+    request = InstrumentedHTTPXRequest(
+        connection_pool_size=Config.CONNECTION_POOL_SIZE,
+        pool_timeout=Config.POOL_TIMEOUT,
+        connect_timeout=Config.CONNECT_TIMEOUT,
+        read_timeout=Config.READ_TIMEOUT,
+        http_version=Config.HTTP_VERSION
+    )
+
+    # Create the Application
+    builder = (
+        Application.builder()
+        .token(bot_token)
+        .request(request)
+        .post_init(bot_handlers.post_init)
+        .post_stop(bot_handlers.post_stop)
+        .post_shutdown(bot_handlers.post_shutdown)
+    )
+    if Config.CONCURRENT_UPDATES > 1:
+        builder = builder.concurrent_updates(PerUserUpdateProcessor(Config.CONCURRENT_UPDATES))
+    application = builder.build()
+
+    # Activity tracking runs before the regular handlers, for every update
+    application.add_handler(TypeHandler(Update, bot_handlers.track_activity), group=-1)
+
     # Add handlers
     application.add_handler(CommandHandler("start", bot_handlers.start))
     application.add_handler(CommandHandler("admin", bot_handlers.admin_panel))
     application.add_handler(CommandHandler("add_movie", bot_handlers.add_movie))
     application.add_handler(CommandHandler("remove_movie", bot_handlers.remove_movie))
     application.add_handler(CommandHandler("list_movies", bot_handlers.list_movies))
+    application.add_handler(CommandHandler("import_movies", bot_handlers.import_movies))
     application.add_handler(CommandHandler("stats", bot_handlers.stats))
+    application.add_handler(CommandHandler("reconcile_stats", bot_handlers.reconcile_stats))
+    application.add_handler(CommandHandler("cache_stats", bot_handlers.cache_stats))
+    application.add_handler(CommandHandler("perf", bot_handlers.perf))
+    application.add_handler(CommandHandler("broadcast", bot_handlers.broadcast))
+    application.add_handler(CommandHandler("broadcast_status", bot_handlers.broadcast_status))
+    application.add_handler(CommandHandler("broadcast_cancel", bot_handlers.broadcast_cancel))
     application.add_handler(CommandHandler("language", bot_handlers.language_menu))
 
     # Callback query handler for inline keyboards
     application.add_handler(CallbackQueryHandler(bot_handlers.button_callback))
 
+    # Inline mode: @bot <code or title>
+    application.add_handler(InlineQueryHandler(bot_handlers.inline_query))
+
     # Message handler for movie codes and file uploads
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, bot_handlers.handle_message))
     application.add_handler(MessageHandler(filters.Document.ALL | filters.VIDEO, bot_handlers.handle_file))
 
-    # Run the bot until the user presses Ctrl-C
-    logger.info("Starting bot...")
-    application.run_polling(allowed_updates=["message", "callback_query"])
-
-if __name__ == '__main__':
-    from keep_alive import keep_alive
-    keep_alive()  # Doimiy ishlash uchun veb-serverni ishga tushuradi
-    main()
-    from keep_alive import keep_alive
-
-    keep_alive()  # Web serverni ishga tushiradi (Replit uni uyg‘otib turadi)
-from keep_alive import keep_alive
+    if Config.RUN_MODE == "webhook":
+        logger.info("Starting bot in webhook mode...")
+        asyncio.run(run_webhook(application, ALLOWED_UPDATES))
+    else:
+        from keep_alive import keep_alive
+        keep_alive()  # Doimiy ishlash uchun veb-serverni ishga tushuradi
 
-def main():
-    application.run_polling()  # yoki sizdagi Application() holatiga qarab
+        # Run the bot until the user presses Ctrl-C
+        logger.info("Starting bot...")
+        application.run_polling(allowed_updates=ALLOWED_UPDATES)
 
-if __name__ == "__main__":
-    keep_alive()
+if __name__ == '__main__':
     main()
-    from keep_alive import keep_alive
-
-    keep_alive()  # Web serverni ishga tushiradi (Replit uni uyg‘otib turadi)
-    main()        # Botni ishga tushiradi
\ No newline at end of file
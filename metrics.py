@@ -0,0 +1,193 @@
+"""
+Lightweight in-process metrics with a Prometheus text exposition
+"""
+
+import bisect
+import functools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from telegram.request import HTTPXRequest
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Recent observations kept per series for live p50/p95/p99
+QUANTILE_WINDOW = 2048
+
+HELP = {
+    'bot_handler_duration_seconds': 'Time spent in each update handler',
+    'bot_handler_errors_total': 'Exceptions raised out of update handlers',
+    'bot_db_duration_seconds': 'Time from queuing a Database call to its result',
+    'bot_api_duration_seconds': 'Bot API request latency by method',
+    'bot_api_errors_total': 'Failed Bot API requests by method',
+    'bot_cache_hits_total': 'Cache hits',
+    'bot_cache_misses_total': 'Cache misses',
+    'bot_cache_size': 'Entries currently cached',
+    'bot_db_statement_duration_seconds': 'SQLite statement time including row fetches, when DB_PROFILING is on',
+    'bot_uploads_coalesced_total': 'Movie sends that reused the file_id of an upload already in flight',
+    'bot_broadcast_messages_total': 'Broadcast deliveries by result',
+    'bot_flood_dropped_total': 'Updates dropped by per-user flood control',
+}
+
+class Histogram:
+    """Cumulative buckets for Prometheus plus a sliding window for quantiles"""
+    
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=QUANTILE_WINDOW)
+    
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.bucket_counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+    
+    def quantiles(self, *qs):
+        """Quantiles over the recent window"""
+        values = sorted(self.recent)
+        if not values:
+            return [0.0 for _ in qs]
+        return [values[min(len(values) - 1, int(q * len(values)))] for q in qs]
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + (list(extra) if extra else [])
+    if not items:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in items) + '}'
+
+class MetricsRegistry:
+    """Thread-safe: observed from the event loop and the database thread,
+    scraped from the web server."""
+    
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+    
+    def observe(self, name, value, **labels):
+        """Record one latency observation, in seconds"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+    
+    def inc(self, name, amount=1, **labels):
+        """Increment a counter"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+    
+    def add_collector(self, collector):
+        """Register a callable returning (name, type, labels, value) samples at scrape time"""
+        self._collectors.append(collector)
+    
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observe the duration of a with-block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+    
+    def latency_summary(self, limit=None):
+        """(series, count, p50, p95, p99) per histogram, busiest first"""
+        with self._lock:
+            rows = [
+                (name + _format_labels(labels), histogram.count, *histogram.quantiles(0.5, 0.95, 0.99))
+                for (name, labels), histogram in self._histograms.items()
+            ]
+        rows.sort(key=lambda row: row[1], reverse=True)
+        return rows[:limit] if limit else rows
+    
+    def render(self):
+        """Prometheus text exposition format"""
+        lines = []
+        typed = set()
+        
+        def header(name, metric_type):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# HELP {name} {HELP.get(name, name)}')
+                lines.append(f'# TYPE {name} {metric_type}')
+        
+        with self._lock:
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                header(name, 'histogram')
+                cumulative = 0
+                for bound, bucket_count in zip(histogram.buckets, histogram.bucket_counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {histogram.count}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {histogram.sum}')
+                lines.append(f'{name}_count{_format_labels(labels)} {histogram.count}')
+            
+            for (name, labels), value in sorted(self._counters.items()):
+                header(name, 'counter')
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+        
+        for collector in self._collectors:
+            try:
+                samples = collector()
+            except Exception as e:
+                print(f"Error collecting metrics: {e}")
+                continue
+            for name, metric_type, labels, value in samples:
+                header(name, metric_type)
+                lines.append(f'{name}{_format_labels(sorted(labels.items()))} {value}')
+        
+        return '\n'.join(lines) + '\n'
+
+def cache_samples(caches):
+    """Collector samples for a {name: LRUCache.stats()} mapping"""
+    samples = []
+    for cache_name, stats in caches.items():
+        labels = {'cache': cache_name}
+        samples.append(('bot_cache_hits_total', 'counter', labels, stats['hits']))
+        samples.append(('bot_cache_misses_total', 'counter', labels, stats['misses']))
+        samples.append(('bot_cache_size', 'gauge', labels, stats['size']))
+    return samples
+
+def timed_handler(func):
+    """Record latency and escaping exceptions for an update handler coroutine"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            metrics.inc('bot_handler_errors_total', handler=func.__name__)
+            raise
+        finally:
+            metrics.observe('bot_handler_duration_seconds', time.perf_counter() - start, handler=func.__name__)
+    return wrapper
+
+class InstrumentedHTTPXRequest(HTTPXRequest):
+    """HTTPXRequest that times every Bot API call by method name"""
+    
+    async def do_request(self, url, method, *args, **kwargs):
+        api_method = url.rsplit('/', 1)[-1]
+        start = time.perf_counter()
+        try:
+            status_code, payload = await super().do_request(url, method, *args, **kwargs)
+        except Exception:
+            metrics.inc('bot_api_errors_total', method=api_method)
+            raise
+        finally:
+            metrics.observe('bot_api_duration_seconds', time.perf_counter() - start, method=api_method)
+        
+        if status_code >= 400:
+            metrics.inc('bot_api_errors_total', method=api_method)
+        return status_code, payload
+
+# Global metrics registry
+metrics = MetricsRegistry()
@@ -0,0 +1,321 @@
+"""
+Versioned schema migrations for the bot database
+
+Each migration runs once, in its own transaction, and bumps
+PRAGMA user_version. Existing databases are upgraded in place.
+Append new migrations to MIGRATIONS; never edit one that has shipped.
+"""
+
+import os
+import threading
+
+# Rebuilds every statistics counter from full table scans
+COUNT_STATS_SQL = '''
+    INSERT OR REPLACE INTO stats_counters (name, value)
+    SELECT 'total_users', COUNT(*) FROM users
+    UNION ALL SELECT 'subscribed_users', COUNT(*) FROM users WHERE is_subscribed = 1
+    UNION ALL SELECT 'total_movies', COUNT(*) FROM movies
+    UNION ALL SELECT 'total_downloads', COUNT(*) FROM downloads
+'''
+
+def _table_columns(cursor, table):
+    cursor.execute(f'PRAGMA table_info({table})')
+    return {row[1] for row in cursor.fetchall()}
+
+def create_base_tables(cursor):
+    """Users, movies and download history"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            language_code TEXT DEFAULT 'uz',
+            is_subscribed BOOLEAN DEFAULT FALSE,
+            instagram_followed BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS movies (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            code TEXT UNIQUE NOT NULL,
+            title TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            file_size INTEGER,
+            uploaded_by INTEGER,
+            upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            download_count INTEGER DEFAULT 0
+        )
+    ''')
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS downloads (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            movie_code TEXT,
+            download_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id),
+            FOREIGN KEY (movie_code) REFERENCES movies (code)
+        )
+    ''')
+
+def add_movie_file_ids(cursor):
+    """Telegram file ids used to resend movies without re-uploading"""
+    movie_columns = _table_columns(cursor, 'movies')
+    for column in ('file_id', 'file_unique_id'):
+        if column not in movie_columns:
+            cursor.execute(f'ALTER TABLE movies ADD COLUMN {column} TEXT')
+
+def add_stats_counters(cursor):
+    """Statistics counters, maintained by triggers in the writing transaction"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stats_counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    
+    triggers = [
+        '''CREATE TRIGGER IF NOT EXISTS users_stats_insert AFTER INSERT ON users BEGIN
+            UPDATE stats_counters SET value = value + 1 WHERE name = 'total_users';
+            UPDATE stats_counters SET value = value + 1
+                WHERE name = 'subscribed_users' AND NEW.is_subscribed = 1;
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS users_stats_delete AFTER DELETE ON users BEGIN
+            UPDATE stats_counters SET value = value - 1 WHERE name = 'total_users';
+            UPDATE stats_counters SET value = value - 1
+                WHERE name = 'subscribed_users' AND OLD.is_subscribed = 1;
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS users_stats_subscription AFTER UPDATE OF is_subscribed ON users
+        WHEN (NEW.is_subscribed = 1) != (OLD.is_subscribed = 1) BEGIN
+            UPDATE stats_counters
+                SET value = value + CASE WHEN NEW.is_subscribed = 1 THEN 1 ELSE -1 END
+                WHERE name = 'subscribed_users';
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS movies_stats_insert AFTER INSERT ON movies BEGIN
+            UPDATE stats_counters SET value = value + 1 WHERE name = 'total_movies';
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS movies_stats_delete AFTER DELETE ON movies BEGIN
+            UPDATE stats_counters SET value = value - 1 WHERE name = 'total_movies';
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS downloads_stats_insert AFTER INSERT ON downloads BEGIN
+            UPDATE stats_counters SET value = value + 1 WHERE name = 'total_downloads';
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS downloads_stats_delete AFTER DELETE ON downloads BEGIN
+            UPDATE stats_counters SET value = value - 1 WHERE name = 'total_downloads';
+        END''',
+    ]
+    for trigger in triggers:
+        cursor.execute(trigger)
+    
+    cursor.execute(COUNT_STATS_SQL)
+
+def add_analytics_indexes(cursor):
+    """Indexes for per-movie, per-user and time-range queries"""
+    # Each composite index also covers COUNT(*)/range scans on its leading column
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_downloads_movie_date ON downloads (movie_code, download_date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_downloads_user_date ON downloads (user_id, download_date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_downloads_date ON downloads (download_date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_is_subscribed ON users (is_subscribed)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_last_activity ON users (last_activity)')
+
+def add_movie_checksums(cursor):
+    """SHA-256 of each movie file, computed while it is stored"""
+    if 'sha256' not in _table_columns(cursor, 'movies'):
+        cursor.execute('ALTER TABLE movies ADD COLUMN sha256 TEXT')
+
+def add_blob_store(cursor):
+    """Content-addressed movie files, reference counted by triggers on movies"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS blobs (
+            sha256 TEXT PRIMARY KEY,
+            file_path TEXT NOT NULL,
+            file_size INTEGER,
+            ref_count INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS movies_blob_insert AFTER INSERT ON movies
+        WHEN NEW.sha256 IS NOT NULL BEGIN
+            UPDATE blobs SET ref_count = ref_count + 1 WHERE sha256 = NEW.sha256;
+        END''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS movies_blob_delete AFTER DELETE ON movies
+        WHEN OLD.sha256 IS NOT NULL BEGIN
+            UPDATE blobs SET ref_count = ref_count - 1 WHERE sha256 = OLD.sha256;
+        END''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS movies_blob_update AFTER UPDATE OF sha256 ON movies
+        WHEN NEW.sha256 IS NOT OLD.sha256 BEGIN
+            UPDATE blobs SET ref_count = ref_count - 1 WHERE sha256 = OLD.sha256;
+            UPDATE blobs SET ref_count = ref_count + 1 WHERE sha256 = NEW.sha256;
+        END''')
+    
+    # Files already hashed on upload become blobs where they are
+    cursor.execute('''
+        INSERT OR IGNORE INTO blobs (sha256, file_path, file_size, ref_count)
+        SELECT sha256, MIN(file_path), MIN(file_size), COUNT(*)
+        FROM movies WHERE sha256 IS NOT NULL GROUP BY sha256
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_movies_file_path ON movies (file_path)')
+
+def add_title_search(cursor):
+    """FTS5 index over movie titles, kept in sync by triggers"""
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS movies_fts USING fts5(
+            title,
+            content='movies',
+            content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    ''')
+    
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS movies_fts_insert AFTER INSERT ON movies BEGIN
+            INSERT INTO movies_fts (rowid, title) VALUES (NEW.id, NEW.title);
+        END''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS movies_fts_delete AFTER DELETE ON movies BEGIN
+            INSERT INTO movies_fts (movies_fts, rowid, title) VALUES ('delete', OLD.id, OLD.title);
+        END''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS movies_fts_update AFTER UPDATE OF title ON movies BEGIN
+            INSERT INTO movies_fts (movies_fts, rowid, title) VALUES ('delete', OLD.id, OLD.title);
+            INSERT INTO movies_fts (rowid, title) VALUES (NEW.id, NEW.title);
+        END''')
+    
+    # Index the existing catalogue
+    cursor.execute("INSERT INTO movies_fts (movies_fts) VALUES ('rebuild')")
+
+def add_broadcasts(cursor):
+    """Admin broadcasts with resumable progress, and blocked-user tracking"""
+    if 'is_blocked' not in _table_columns(cursor, 'users'):
+        cursor.execute('ALTER TABLE users ADD COLUMN is_blocked BOOLEAN NOT NULL DEFAULT FALSE')
+    
+    # A broadcast sends either text or a copy of from_chat_id/message_id;
+    # recipients are walked in user_id order with last_user_id as the cursor
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_by INTEGER,
+            text TEXT,
+            from_chat_id INTEGER,
+            message_id INTEGER,
+            status TEXT NOT NULL DEFAULT 'running',
+            last_user_id INTEGER NOT NULL DEFAULT 0,
+            sent_count INTEGER NOT NULL DEFAULT 0,
+            failed_count INTEGER NOT NULL DEFAULT 0,
+            blocked_count INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_broadcasts_status ON broadcasts (status)')
+
+def add_shared_state(cursor):
+    """State shared by every bot process: conversations, cache invalidations, broadcast leases"""
+    # Per-user conversation state, e.g. an admin's /add_movie waiting for its file.
+    # value is JSON; expires_at is a Unix timestamp
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS conversation_state (
+            user_id INTEGER NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT NOT NULL,
+            expires_at REAL NOT NULL,
+            PRIMARY KEY (user_id, key)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_conversation_state_expires ON conversation_state (expires_at)')
+    
+    # Rows whose cached copies other processes must drop, logged by triggers.
+    # Only columns that cached reads depend on are watched, so download and
+    # activity bookkeeping does not flood the log
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cache_invalidations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS movies_invalidate_insert AFTER INSERT ON movies BEGIN
+            INSERT INTO cache_invalidations (kind, key) VALUES ('movie', NEW.code);
+        END''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS movies_invalidate_delete AFTER DELETE ON movies BEGIN
+            INSERT INTO cache_invalidations (kind, key) VALUES ('movie', OLD.code);
+        END''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS movies_invalidate_update
+        AFTER UPDATE OF code, title, filename, file_path, file_size, file_id, file_unique_id, sha256 ON movies BEGIN
+            INSERT INTO cache_invalidations (kind, key) VALUES ('movie', NEW.code);
+            INSERT INTO cache_invalidations (kind, key) SELECT 'movie', OLD.code WHERE OLD.code IS NOT NEW.code;
+        END''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS users_invalidate_insert AFTER INSERT ON users BEGIN
+            INSERT INTO cache_invalidations (kind, key) VALUES ('user', NEW.user_id);
+        END''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS users_invalidate_update
+        AFTER UPDATE OF username, first_name, last_name, language_code, is_subscribed, instagram_followed ON users BEGIN
+            INSERT INTO cache_invalidations (kind, key) VALUES ('user', NEW.user_id);
+        END''')
+    
+    # The process sending a broadcast holds a lease on it and renews it every batch
+    columns = _table_columns(cursor, 'broadcasts')
+    if 'worker_id' not in columns:
+        cursor.execute('ALTER TABLE broadcasts ADD COLUMN worker_id TEXT')
+    if 'lease_expires_at' not in columns:
+        cursor.execute('ALTER TABLE broadcasts ADD COLUMN lease_expires_at REAL')
+
+def add_job_leases(cursor):
+    """Leases that let one of several bot processes run a periodic job"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS job_leases (
+            name TEXT PRIMARY KEY,
+            worker_id TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    ''')
+
+# Position in this list + 1 is the schema version a migration produces
+MIGRATIONS = [
+    create_base_tables,
+    add_movie_file_ids,
+    add_stats_counters,
+    add_analytics_indexes,
+    add_movie_checksums,
+    add_blob_store,
+    add_title_search,
+    add_broadcasts,
+    add_shared_state,
+    add_job_leases,
+]
+
+_migrated_paths = set()
+_migrated_lock = threading.Lock()
+
+def get_version(conn):
+    """Current schema version of the database"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(conn, db_path):
+    """Bring the database up to date; runs at most once per process and path"""
+    key = os.path.abspath(db_path)
+    with _migrated_lock:
+        if key in _migrated_paths:
+            return
+        
+        cursor = conn.cursor()
+        try:
+            for target in range(1, len(MIGRATIONS) + 1):
+                # IMMEDIATE takes the write lock, so concurrent processes upgrade one at a time
+                cursor.execute('BEGIN IMMEDIATE')
+                try:
+                    if get_version(conn) < target:
+                        MIGRATIONS[target - 1](cursor)
+                        cursor.execute(f'PRAGMA user_version = {target}')
+                    cursor.execute('COMMIT')
+                except BaseException:
+                    cursor.execute('ROLLBACK')
+                    raise
+        finally:
+            cursor.close()
+        
+        _migrated_paths.add(key)
@@ -0,0 +1,48 @@
+"""
+In-memory prefix index over movie codes and titles
+"""
+
+from bisect import bisect_left
+
+def normalize(text):
+    """Lower-case text with whitespace collapsed"""
+    return ' '.join(text.lower().split())
+
+class PrefixIndex:
+    """Sorted keys for prefix lookups with bisect.
+    
+    Each movie is indexed under its code, its full title and every word
+    of its title, so "tita", "1" and "the tit" all find their movies.
+    """
+    
+    def __init__(self, movies):
+        self._movies = list(movies)
+        entries = []
+        for position, movie in enumerate(self._movies):
+            code, title = movie[0], normalize(movie[1])
+            keys = {code.lower(), title, *title.split()}
+            entries.extend((key, position) for key in keys)
+        entries.sort()
+        self._keys = [key for key, _ in entries]
+        self._positions = [position for _, position in entries]
+    
+    def __len__(self):
+        return len(self._movies)
+    
+    def search(self, prefix, limit):
+        """Movies with a key starting with prefix, at most limit of them"""
+        prefix = normalize(prefix)
+        results = []
+        seen = set()
+        
+        for index in range(bisect_left(self._keys, prefix), len(self._keys)):
+            if not self._keys[index].startswith(prefix):
+                break
+            position = self._positions[index]
+            if position not in seen:
+                seen.add(position)
+                results.append(self._movies[position])
+                if len(results) >= limit:
+                    break
+        
+        return results
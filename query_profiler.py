@@ -0,0 +1,144 @@
+"""
+Opt-in SQLite statement profiling: timings, slow-query log and query plans
+"""
+
+import logging
+import re
+import sqlite3
+import time
+from bot.config import Config
+from bot.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Statements whose plan is worth capturing
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE')
+
+def normalize_sql(sql):
+    """Single-line form of a statement, used in logs and as a metric label"""
+    return re.sub(r'\s+', ' ', sql).strip()
+
+def parameter_shape(parameters):
+    """Types of bind parameters, without their values"""
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    return tuple(type(value).__name__ for value in parameters)
+
+class ProfilingCursor(sqlite3.Cursor):
+    """Times execute/executemany plus the fetches that follow them.
+    
+    A statement is reported when the next one starts or the cursor closes,
+    so time spent stepping through result rows is included.
+    """
+    
+    _statement = None
+    # Set for cursors behind Connection.execute, which callers rarely close
+    _finish_after_fetch = False
+    
+    def execute(self, sql, parameters=()):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._statement = [sql, parameters, parameter_shape(parameters), time.perf_counter() - start]
+    
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        seq_of_parameters = list(seq_of_parameters)
+        first = seq_of_parameters[0] if seq_of_parameters else ()
+        shape = f"{len(seq_of_parameters)} x {parameter_shape(first)}"
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._statement = [sql, first, shape, time.perf_counter() - start]
+    
+    def _timed_fetch(self, fetch, *args):
+        start = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            if self._statement is not None:
+                self._statement[3] += time.perf_counter() - start
+                if self._finish_after_fetch:
+                    self._finish()
+    
+    def fetchone(self):
+        return self._timed_fetch(super().fetchone)
+    
+    def fetchmany(self, *args):
+        return self._timed_fetch(super().fetchmany, *args)
+    
+    def fetchall(self):
+        return self._timed_fetch(super().fetchall)
+    
+    def close(self):
+        self._finish()
+        super().close()
+    
+    def _finish(self):
+        if self._statement is not None:
+            statement, self._statement = self._statement, None
+            self.connection.record_statement(*statement)
+
+class ProfilingConnection(sqlite3.Connection):
+    """Connection whose cursors are profiled; used when Config.DB_PROFILING is on"""
+    
+    def cursor(self, factory=ProfilingCursor):
+        return super().cursor(factory)
+    
+    def execute(self, sql, parameters=()):
+        cursor = self.cursor()
+        return self._execute_on(cursor, cursor.execute, sql, parameters)
+    
+    def executemany(self, sql, seq_of_parameters):
+        cursor = self.cursor()
+        return self._execute_on(cursor, cursor.executemany, sql, seq_of_parameters)
+    
+    @staticmethod
+    def _execute_on(cursor, execute, sql, parameters):
+        """Run a shortcut statement on a profiled cursor and record it right
+        after its rows are fetched, or at once if it returns none"""
+        try:
+            execute(sql, parameters)
+        except BaseException:
+            cursor.close()
+            raise
+        if cursor.description is None:
+            cursor._finish()
+        else:
+            cursor._finish_after_fetch = True
+        return cursor
+    
+    def record_statement(self, sql, parameters, shape, elapsed):
+        statement = normalize_sql(sql)
+        metrics.observe('bot_db_statement_duration_seconds', elapsed, statement=statement[:80].replace('"', "'"))
+        
+        if elapsed * 1000 < Config.DB_SLOW_QUERY_MS:
+            return
+        
+        logger.warning("Slow query (%.1f ms): %s params=%s", elapsed * 1000, statement, shape)
+        if Config.DB_EXPLAIN_SLOW_QUERIES and statement.upper().startswith(EXPLAINABLE):
+            plan = self.explain(sql, parameters)
+            if plan:
+                logger.warning("Query plan:\n%s", plan)
+    
+    def explain(self, sql, parameters=()):
+        """EXPLAIN QUERY PLAN output as indented text"""
+        # A plain cursor, so the EXPLAIN itself is not profiled
+        cursor = super().cursor()
+        try:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', parameters)
+            rows = cursor.fetchall()
+        except sqlite3.Error as e:
+            return f"(unavailable: {e})"
+        finally:
+            cursor.close()
+        
+        depth = {0: 0}
+        lines = []
+        for node_id, parent_id, _, detail in rows:
+            depth[node_id] = depth.get(parent_id, 0) + 1
+            lines.append('  ' * depth[node_id] + detail)
+        return '\n'.join(lines)
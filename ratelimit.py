@@ -0,0 +1,105 @@
+"""
+Token-bucket rate limiting
+"""
+
+import asyncio
+import time
+
+class TokenBucket:
+    """Allows rate events per second on average, with bursts of up to capacity"""
+    
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+    
+    def __init__(self, rate, capacity=None, now=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic() if now is None else now
+    
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+    
+    def consume(self, now=None):
+        """Take a token if one is available; returns whether it was"""
+        self._refill(time.monotonic() if now is None else now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+    
+    async def acquire(self):
+        """Wait until a token is available and take it"""
+        while not self.consume():
+            wait = max(self.updated - time.monotonic(), 0) + (1 - self.tokens) / self.rate
+            await asyncio.sleep(wait)
+    
+    def pause(self, seconds):
+        """Hand out no tokens for the next seconds, e.g. after a RetryAfter"""
+        self.tokens = 0
+        self.updated = max(self.updated, time.monotonic() + seconds)
+
+# FloodControl.check verdicts
+ALLOW = 'allow'
+DROP = 'drop'
+WARN = 'warn'
+
+class _UserFloodState:
+    __slots__ = ('bucket', 'last_key', 'last_at', 'warned')
+    
+    def __init__(self, bucket, now):
+        self.bucket = bucket
+        self.last_key = None
+        self.last_at = now
+        self.warned = False
+
+class FloodControl:
+    """Per-user token buckets plus suppression of repeated identical requests.
+    
+    Users idle for idle_ttl seconds are evicted, so memory follows the
+    number of recently active users rather than every user ever seen.
+    """
+    
+    def __init__(self, rate, burst, duplicate_window, idle_ttl):
+        self.rate = rate
+        self.burst = burst
+        self.duplicate_window = duplicate_window
+        self.idle_ttl = idle_ttl
+        self._users = {}
+        self._last_sweep = time.monotonic()
+    
+    def __len__(self):
+        return len(self._users)
+    
+    def check(self, user_id, key, now=None):
+        """ALLOW the request, DROP it, or WARN once per throttled stretch and drop it"""
+        if now is None:
+            now = time.monotonic()
+        if now - self._last_sweep > self.idle_ttl:
+            self._evict_idle(now)
+        
+        state = self._users.get(user_id)
+        if state is None:
+            state = self._users[user_id] = _UserFloodState(TokenBucket(self.rate, self.burst, now), now)
+        
+        # The same code or button again while the first one is being served
+        if key == state.last_key and now - state.last_at < self.duplicate_window:
+            return DROP
+        
+        if not state.bucket.consume(now):
+            if state.warned:
+                return DROP
+            state.warned = True
+            return WARN
+        
+        state.last_key = key
+        state.last_at = now
+        state.warned = False
+        return ALLOW
+    
+    def _evict_idle(self, now):
+        cutoff = now - self.idle_ttl
+        # Every request that is not a duplicate refreshes bucket.updated
+        self._users = {user_id: state for user_id, state in self._users.items() if state.bucket.updated >= cutoff}
+        self._last_sweep = now
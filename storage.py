@@ -0,0 +1,147 @@
+"""
+Content-addressed movie storage
+
+Movie files are stored once per distinct content, as
+MOVIES_DIR/blobs/<sha256[:2]>/<sha256>, and shared by every code that
+points at them. The blobs table keeps a reference count (maintained by
+triggers on movies) so a file is deleted only when no code uses it.
+
+Run `python -m bot.storage migrate` once to move files stored by code
+(MOVIES_DIR/<code><ext>) into the blob store.
+"""
+
+import hashlib
+import os
+import shutil
+import sys
+import uuid
+from bot.config import Config
+
+CHUNK_SIZE = 1024 * 1024
+
+def iter_chunks(data, chunk_size=CHUNK_SIZE):
+    """Slice a bytes-like object into chunks without copying it"""
+    view = memoryview(data)
+    for offset in range(0, len(view), chunk_size):
+        yield view[offset:offset + chunk_size]
+
+def iter_file_chunks(path, chunk_size=CHUNK_SIZE):
+    """Read a file in chunks"""
+    with open(path, 'rb') as source:
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+def blobs_dir():
+    return os.path.join(Config.MOVIES_DIR, 'blobs')
+
+def blob_path(sha256):
+    """Where the blob with this digest lives"""
+    return os.path.join(blobs_dir(), sha256[:2], sha256)
+
+def is_blob_path(path):
+    return os.path.abspath(path).startswith(os.path.abspath(blobs_dir()) + os.sep)
+
+def staging_path():
+    """Unique staging file inside MOVIES_DIR, so the final rename never crosses filesystems"""
+    return os.path.join(Config.MOVIES_DIR, f".staging-{uuid.uuid4().hex}.part")
+
+def stage_hashed(chunks):
+    """Write chunks to a staging file while hashing them.
+    
+    Blocking; run it in a worker thread. Returns (staging_path, size, sha256).
+    """
+    staging = staging_path()
+    digest = hashlib.sha256()
+    size = 0
+    
+    try:
+        with open(staging, 'wb') as staged_file:
+            for chunk in chunks:
+                staged_file.write(chunk)
+                digest.update(chunk)
+                size += len(chunk)
+            staged_file.flush()
+            os.fsync(staged_file.fileno())
+    except BaseException:
+        discard(staging)
+        raise
+    
+    return staging, size, digest.hexdigest()
+
+def commit_blob(staging, sha256):
+    """Atomically move a staged file into the blob store, or drop it if the
+    content is already stored. Returns the blob path."""
+    destination = blob_path(sha256)
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    
+    if os.path.exists(destination):
+        discard(staging)
+    else:
+        os.replace(staging, destination)
+    return destination
+
+def discard(path):
+    """Remove a file if it exists"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def hash_file(path):
+    """(size, sha256) of a file on disk"""
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in iter_file_chunks(path):
+        digest.update(chunk)
+        size += len(chunk)
+    return size, digest.hexdigest()
+
+def migrate_legacy_files(db):
+    """Move movies stored outside the blob store into it, deduplicating.
+    
+    Files are hard-linked (or copied) into place before the row is updated,
+    so an interrupted run leaves every movie readable and can be repeated.
+    Returns (migrated, deduplicated, missing) counts.
+    """
+    migrated = deduplicated = 0
+    missing = []
+    
+    for movie_id, code, file_path in db.list_legacy_movie_files():
+        if is_blob_path(file_path):
+            continue
+        if not os.path.exists(file_path):
+            missing.append(code)
+            continue
+        
+        size, sha256 = hash_file(file_path)
+        destination = blob_path(sha256)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        
+        if os.path.exists(destination):
+            deduplicated += 1
+        else:
+            try:
+                os.link(file_path, destination)
+            except OSError:
+                shutil.copy2(file_path, destination)
+        
+        db.relink_movie_blob(movie_id, sha256, destination, size)
+        if not db.is_file_referenced(file_path):
+            discard(file_path)
+        migrated += 1
+    
+    return migrated, deduplicated, missing
+
+if __name__ == '__main__':
+    if sys.argv[1:] != ['migrate']:
+        print("Usage: python -m bot.storage migrate")
+        sys.exit(2)
+    
+    from bot.database import Database
+    migrated, deduplicated, missing = migrate_legacy_files(Database())
+    print(f"Migrated {migrated} movies into the blob store ({deduplicated} deduplicated)")
+    if missing:
+        print(f"Files missing for codes: {', '.join(missing)}")
@@ -3,29 +3,123 @@ Subscription verification functionality
 """
 
 import asyncio
-from telegram import Bot
 from telegram.error import TelegramError
+from bot.cache import LRUCache, MISSING
 from bot.config import Config
+from bot.database import WORKER_ID
 
 class SubscriptionChecker:
-    def __init__(self, bot_token):
-        self.bot = Bot(token=bot_token)
+    def __init__(self, bot):
+        # The application's bot, so checks share its HTTP connection pool
+        self.bot = bot
+        # Members are trusted for a long TTL; a negative answer only holds
+        # for the cooldown, which also caps how often a user can trigger a live check
+        self.member_cache = LRUCache(Config.SUBSCRIPTION_CACHE_SIZE, Config.SUBSCRIPTION_CACHE_TTL)
+        self.non_member_cache = LRUCache(Config.SUBSCRIPTION_CACHE_SIZE, Config.SUBSCRIPTION_CHECK_COOLDOWN)
+        self._reverify_task = None
     
     async def check_channel_subscription(self, user_id):
         """Check if user is subscribed to the Telegram channel"""
+        if self.member_cache.get(user_id) is not MISSING:
+            return True
+        if self.non_member_cache.get(user_id) is not MISSING:
+            return False
+        
+        return bool(await self.fetch_membership(user_id))
+    
+    async def fetch_membership(self, user_id):
+        """Ask Telegram about a user and refresh the cache.
+        
+        Returns True or False, or None if Telegram could not answer.
+        """
         try:
             # Get chat member status
             member = await self.bot.get_chat_member(
                 chat_id=f"@{Config.TELEGRAM_CHANNEL}",
                 user_id=user_id
             )
-            
-            # Check if user is a member (not left or kicked)
-            return member.status in ['member', 'administrator', 'creator']
-            
         except TelegramError as e:
             print(f"Error checking subscription: {e}")
-            return False
+            # Errors also wait out the cooldown instead of retrying on every press
+            self.non_member_cache.set(user_id, False)
+            return None
+        
+        # Check if user is a member (not left or kicked)
+        is_member = member.status in ['member', 'administrator', 'creator']
+        if is_member:
+            self.non_member_cache.invalidate(user_id)
+            self.member_cache.set(user_id, True)
+        else:
+            self.member_cache.invalidate(user_id)
+            self.non_member_cache.set(user_id, False)
+        return is_member
+    
+    def cache_stats(self):
+        """Hit/miss counters of the membership caches"""
+        return {
+            'channel_members': self.member_cache.stats(),
+            'channel_non_members': self.non_member_cache.stats()
+        }
+    
+    async def reverify_subscribers(self, db, lease=None):
+        """Re-check every user marked as subscribed, at a bounded request rate.
+        
+        Users who left the channel are marked unsubscribed. Users Telegram
+        could not answer for keep their status until the next run. With a
+        lease name, the job lease is renewed after every batch and the run
+        stops if another process has taken it.
+        """
+        delay = 1 / Config.SUBSCRIPTION_REVERIFY_RATE
+        after_user_id = 0
+        unsubscribed = 0
+        
+        while True:
+            user_ids = await db.get_subscribed_user_ids(after_user_id, Config.SUBSCRIPTION_REVERIFY_BATCH)
+            if not user_ids:
+                break
+            
+            for user_id in user_ids:
+                if await self.fetch_membership(user_id) is False:
+                    await db.update_subscription_status(user_id, False)
+                    unsubscribed += 1
+                await asyncio.sleep(delay)
+            
+            after_user_id = user_ids[-1]
+            if lease and not await db.acquire_lease(lease, WORKER_ID, Config.SUBSCRIPTION_REVERIFY_INTERVAL):
+                print("Subscription re-verification lease lost, stopping this run")
+                break
+        
+        return unsubscribed
+    
+    async def _reverify_periodically(self, db):
+        interval = Config.SUBSCRIPTION_REVERIFY_INTERVAL
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                # With several bot processes on one database, one run per interval in total
+                if not await db.acquire_lease('subscription_reverify', WORKER_ID, interval):
+                    continue
+                unsubscribed = await self.reverify_subscribers(db, lease='subscription_reverify')
+                # Next run is due an interval after this one finished
+                await db.acquire_lease('subscription_reverify', WORKER_ID, interval)
+                print(f"Subscription re-verification done: {unsubscribed} users unsubscribed")
+            except Exception as e:
+                print(f"Error re-verifying subscriptions: {e}")
+    
+    def start_reverification(self, db):
+        """Start the background re-verification job, if enabled"""
+        if Config.SUBSCRIPTION_REVERIFY_INTERVAL > 0 and self._reverify_task is None:
+            self._reverify_task = asyncio.create_task(self._reverify_periodically(db))
+    
+    async def stop_reverification(self):
+        """Cancel the background re-verification job"""
+        if self._reverify_task is not None:
+            self._reverify_task.cancel()
+            try:
+                await self._reverify_task
+            except asyncio.CancelledError:
+                pass
+            self._reverify_task = None
     
     def get_subscription_keyboard(self, language_code):
         """Get subscription verification keyboard with skip option"""
@@ -0,0 +1,26 @@
+"""
+Make the repository importable as the ``bot`` package, as the modules expect
+"""
+
+import os
+import sys
+import types
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if 'bot' not in sys.modules:
+    package = types.ModuleType('bot')
+    package.__path__ = [ROOT]
+    sys.modules['bot'] = package
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh, fully migrated database in a temporary directory"""
+    from bot.config import Config
+    from bot.database import Database
+    
+    monkeypatch.setattr(Config, 'DATABASE_PATH', str(tmp_path / 'bot_database.db'))
+    database = Database()
+    yield database
+    database.close()
@@ -0,0 +1,42 @@
+"""
+Schema migrations against the shipped database
+"""
+
+import os
+import shutil
+import sqlite3
+import pytest
+from bot.config import Config
+from bot.database import Database
+from bot.migrations import MIGRATIONS, get_version
+
+SHIPPED_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bot_database.db')
+
+@pytest.fixture
+def legacy_db(tmp_path, monkeypatch):
+    """A copy of the bot_database.db that predates versioned migrations"""
+    path = tmp_path / 'bot_database.db'
+    shutil.copy(SHIPPED_DB, path)
+    monkeypatch.setattr(Config, 'DATABASE_PATH', str(path))
+    db = Database()
+    yield db
+    db.close()
+
+def test_shipped_database_starts_unversioned():
+    conn = sqlite3.connect(SHIPPED_DB)
+    try:
+        assert get_version(conn) == 0
+    finally:
+        conn.close()
+
+def test_upgrade_reaches_latest_version(legacy_db):
+    assert get_version(legacy_db.conn) == len(MIGRATIONS)
+
+def test_upgrade_keeps_rows_and_seeds_counters(legacy_db):
+    assert legacy_db.get_movie('76')[2] == 'Hayvonlar shahri 2'
+    assert legacy_db.get_stats() == {
+        'total_users': 2,
+        'subscribed_users': 0,
+        'total_movies': 1,
+        'total_downloads': 1,
+    }
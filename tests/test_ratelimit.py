@@ -0,0 +1,72 @@
+"""
+Token buckets and per-user flood control
+"""
+
+import asyncio
+import time
+from bot.ratelimit import ALLOW, DROP, WARN, FloodControl, TokenBucket
+
+def test_bucket_allows_burst_then_refills():
+    bucket = TokenBucket(rate=2, capacity=3, now=0.0)
+    assert [bucket.consume(now=0.0) for _ in range(4)] == [True, True, True, False]
+    assert bucket.consume(now=0.4) is False
+    assert bucket.consume(now=0.5) is True  # one token after half a second at 2/s
+
+def test_bucket_never_exceeds_capacity():
+    bucket = TokenBucket(rate=10, capacity=2, now=0.0)
+    assert [bucket.consume(now=100.0) for _ in range(3)] == [True, True, False]
+
+def test_bucket_pause_withholds_tokens():
+    bucket = TokenBucket(rate=1000, capacity=5)
+    bucket.pause(0.2)
+    assert bucket.consume() is False
+    
+    start = time.monotonic()
+    asyncio.run(bucket.acquire())
+    assert time.monotonic() - start >= 0.15
+
+def flood_control():
+    return FloodControl(rate=1, burst=2, duplicate_window=3, idle_ttl=600)
+
+def test_duplicates_are_dropped_within_window():
+    flood = flood_control()
+    assert flood.check(1, 'code', now=0.0) == ALLOW
+    assert flood.check(1, 'code', now=1.0) == DROP
+    assert flood.check(1, 'code', now=3.5) == ALLOW
+
+def test_duplicates_do_not_use_tokens():
+    flood = flood_control()
+    assert flood.check(1, 'a', now=0.0) == ALLOW
+    for _ in range(5):
+        assert flood.check(1, 'a', now=0.1) == DROP
+    assert flood.check(1, 'b', now=0.1) == ALLOW
+
+def test_single_warning_per_throttled_stretch():
+    flood = flood_control()
+    assert flood.check(1, 'a', now=0.0) == ALLOW
+    assert flood.check(1, 'b', now=0.0) == ALLOW
+    assert flood.check(1, 'c', now=0.0) == WARN
+    assert flood.check(1, 'd', now=0.1) == DROP
+    assert flood.check(1, 'e', now=0.2) == DROP
+    
+    # Allowed again once a token refills, and the next stretch warns again
+    assert flood.check(1, 'f', now=1.0) == ALLOW
+    assert flood.check(1, 'g', now=1.0) == WARN
+
+def test_users_are_limited_independently():
+    flood = flood_control()
+    flood.check(1, 'a', now=0.0)
+    flood.check(1, 'b', now=0.0)
+    assert flood.check(1, 'c', now=0.0) == WARN
+    assert flood.check(2, 'c', now=0.0) == ALLOW
+
+def test_idle_users_are_evicted():
+    flood = FloodControl(rate=1, burst=2, duplicate_window=3, idle_ttl=60)
+    start = flood._last_sweep
+    flood.check(1, 'a', now=start)
+    flood.check(2, 'a', now=start + 50)
+    assert len(flood) == 2
+    
+    # The sweep runs once idle_ttl has passed since the last one
+    flood.check(3, 'a', now=start + 100)
+    assert len(flood) == 2  # user 1 dropped, user 2 still recent
@@ -0,0 +1,22 @@
+"""
+Statistics counters kept by triggers
+"""
+
+def test_triggers_keep_counters_exact(db):
+    db.add_user(1, 'new_user')
+    db.add_user(1, 'renamed')  # update, not a second user
+    db.add_user(2, 'other')
+    db.update_subscription_status(1, True)
+    db.add_movie('76', 'Old', '76.mp4', 'movies/76.mp4', 10, 1)
+    db.add_movie('77', 'Title', '77.mp4', 'movies/77.mp4', 10, 1)
+    db.record_downloads([(1, '77', '2026-01-01 00:00:00'), (2, '76', '2026-01-01 00:00:00')])
+    db.remove_movie('76')
+    
+    counters = db.get_stats()
+    assert counters == {
+        'total_users': 2,
+        'subscribed_users': 1,
+        'total_movies': 1,
+        'total_downloads': 2,
+    }
+    assert db.reconcile_stats() == counters
@@ -0,0 +1,26 @@
+"""
+Blob reference counting
+"""
+
+SHA = 'a' * 64
+BLOB_PATH = 'movies/blobs/aa/' + SHA
+
+def test_blob_reference_counts(db):
+    db.add_movie('1', 'One', '1.mp4', BLOB_PATH, 10, 1, sha256=SHA)
+    db.add_movie('2', 'Two', '2.mp4', BLOB_PATH, 10, 1, sha256=SHA)
+    
+    db.remove_movie('1')
+    assert db.release_blob(SHA) is None  # still used by movie 2
+    
+    db.remove_movie('2')
+    assert db.release_blob(SHA) == BLOB_PATH
+
+def test_blob_stored_and_removed_under_lock(db):
+    stored, removed = [], []
+    db.add_movie('1', 'One', '1.mp4', BLOB_PATH, 10, 1, sha256=SHA, store_file=lambda: stored.append(SHA))
+    assert stored == [SHA]
+    
+    assert db.release_blob(SHA, remove_file=removed.append) is None
+    db.remove_movie('1')
+    assert db.release_blob(SHA, remove_file=removed.append) == BLOB_PATH
+    assert removed == [BLOB_PATH]
@@ -0,0 +1,62 @@
+"""
+Concurrent update processing that keeps each user's updates in order
+"""
+
+import asyncio
+from telegram.ext import BaseUpdateProcessor
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Runs up to max_concurrent_updates updates at once.
+    
+    Updates from the same user are processed strictly one after another,
+    in arrival order, so multi-step flows such as /add_movie followed by
+    the file upload keep working. Updates from different users run in
+    parallel.
+    """
+    
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        self._user_locks = {}
+        self._user_refs = {}
+    
+    @staticmethod
+    def ordering_key(update):
+        """User the update belongs to, falling back to the chat; None if neither"""
+        user = getattr(update, 'effective_user', None)
+        if user is not None:
+            return user.id
+        chat = getattr(update, 'effective_chat', None)
+        if chat is not None:
+            return chat.id
+        return None
+    
+    async def process_update(self, update, coroutine):
+        key = self.ordering_key(update)
+        if key is None:
+            await super().process_update(update, coroutine)
+            return
+        
+        # Queue on the user's lock before taking a concurrency slot, so one
+        # busy user cannot fill every slot with updates that are only waiting
+        lock = self._user_locks.get(key)
+        if lock is None:
+            lock = self._user_locks[key] = asyncio.Lock()
+        self._user_refs[key] = self._user_refs.get(key, 0) + 1
+        
+        try:
+            async with lock:
+                await super().process_update(update, coroutine)
+        finally:
+            self._user_refs[key] -= 1
+            if not self._user_refs[key]:
+                del self._user_refs[key]
+                del self._user_locks[key]
+    
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+    
+    async def initialize(self):
+        pass
+    
+    async def shutdown(self):
+        pass
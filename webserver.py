@@ -0,0 +1,91 @@
+"""
+Asynchronous HTTP server: webhook updates and health check on the bot's event loop
+"""
+
+import asyncio
+import logging
+import signal
+from aiohttp import web
+from telegram import Update
+from bot.config import Config
+from bot.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+SECRET_TOKEN_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+def create_web_app(application):
+    """aiohttp app serving the health check, metrics and the webhook endpoint"""
+    
+    async def health(request):
+        return web.Response(text="I am alive")
+    
+    async def metrics_endpoint(request):
+        return web.Response(text=metrics.render(), content_type='text/plain', charset='utf-8')
+    
+    async def webhook(request):
+        # Only local testing without a public URL accepts unauthenticated updates
+        if (Config.WEBHOOK_URL or Config.WEBHOOK_SECRET) and \
+                request.headers.get(SECRET_TOKEN_HEADER) != Config.WEBHOOK_SECRET:
+            return web.Response(status=403)
+        
+        try:
+            update = Update.de_json(await request.json(), application.bot)
+        except Exception as e:
+            logger.warning("Rejected malformed webhook payload: %s", e)
+            return web.Response(status=400)
+        
+        # Processed by the application exactly like a polled update
+        await application.update_queue.put(update)
+        return web.Response()
+    
+    web_app = web.Application()
+    web_app.router.add_get('/', health)
+    web_app.router.add_get('/metrics', metrics_endpoint)
+    web_app.router.add_post(Config.WEBHOOK_PATH, webhook)
+    return web_app
+
+async def run_webhook(application, allowed_updates):
+    """Run the bot in webhook mode until SIGINT/SIGTERM.
+    
+    If WEBHOOK_URL is empty the webhook is not registered with Telegram,
+    which allows local testing by POSTing update JSON to WEBHOOK_PATH.
+    A public WEBHOOK_URL requires WEBHOOK_SECRET, since anyone could
+    otherwise post updates pretending to come from an admin.
+    """
+    if Config.WEBHOOK_URL and not Config.WEBHOOK_SECRET:
+        raise RuntimeError("WEBHOOK_SECRET must be set when WEBHOOK_URL is")
+    
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+    
+    runner = web.AppRunner(create_web_app(application))
+    
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    
+    try:
+        await runner.setup()
+        await web.TCPSite(runner, Config.WEB_HOST, Config.WEB_PORT).start()
+        logger.info("Listening for webhook updates on %s:%s%s", Config.WEB_HOST, Config.WEB_PORT, Config.WEBHOOK_PATH)
+        
+        if Config.WEBHOOK_URL:
+            await application.bot.set_webhook(
+                url=Config.WEBHOOK_URL.rstrip('/') + Config.WEBHOOK_PATH,
+                allowed_updates=allowed_updates,
+                secret_token=Config.WEBHOOK_SECRET
+            )
+        
+        await stop_event.wait()
+    finally:
+        await runner.cleanup()
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+        await application.shutdown()
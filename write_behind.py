@@ -0,0 +1,138 @@
+"""
+Write-behind buffering for high-volume database writes
+"""
+
+import asyncio
+from datetime import datetime, timezone
+from bot.config import Config
+
+def utc_timestamp():
+    """Current time in SQLite's CURRENT_TIMESTAMP format"""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+class WriteBehindBuffer:
+    """Base for buffers that are flushed every flush_interval seconds and on stop().
+    
+    Subclasses implement _take_batch, _write and _restore.
+    """
+    
+    def __init__(self, db, flush_interval):
+        self.db = db
+        self.flush_interval = flush_interval
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self._background_flushes = set()
+    
+    def _take_batch(self):
+        """Remove and return everything pending, or None if there is nothing"""
+        raise NotImplementedError
+    
+    async def _write(self, batch):
+        raise NotImplementedError
+    
+    def _restore(self, batch):
+        """Put a batch that failed to write back for the next attempt"""
+        raise NotImplementedError
+    
+    def _flush_soon(self):
+        """Flush in the background without making the caller wait"""
+        if self._flush_lock.locked():
+            return
+        task = asyncio.create_task(self.flush())
+        self._background_flushes.add(task)
+        task.add_done_callback(self._background_flushes.discard)
+    
+    async def flush(self):
+        """Write everything pending in a single transaction"""
+        async with self._flush_lock:
+            batch = self._take_batch()
+            if not batch:
+                return
+            
+            try:
+                await self._write(batch)
+            except Exception as e:
+                print(f"Error flushing {type(self).__name__} ({len(batch)} entries): {e}")
+                self._restore(batch)
+    
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+    
+    def start(self):
+        """Start the periodic flush task"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_periodically())
+    
+    async def stop(self):
+        """Stop the periodic task and flush whatever is still pending"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        
+        if self._background_flushes:
+            await asyncio.gather(*self._background_flushes, return_exceptions=True)
+        await self.flush()
+
+class DownloadBuffer(WriteBehindBuffer):
+    """Collects download events in memory and writes them in batches.
+    
+    A flush happens every flush_interval seconds, or as soon as batch_size
+    events are pending, and always on stop().
+    """
+    
+    def __init__(self, db, flush_interval=None, batch_size=None):
+        super().__init__(db, flush_interval or Config.DOWNLOAD_FLUSH_INTERVAL)
+        self.batch_size = batch_size or Config.DOWNLOAD_FLUSH_BATCH_SIZE
+        self._pending = []
+    
+    def add(self, user_id, movie_code):
+        """Queue a download; never waits for the database"""
+        self._pending.append((user_id, movie_code, utc_timestamp()))
+        if len(self._pending) >= self.batch_size:
+            self._flush_soon()
+    
+    def _take_batch(self):
+        batch, self._pending = self._pending, []
+        return batch
+    
+    async def _write(self, batch):
+        await self.db.record_downloads(batch)
+    
+    def _restore(self, batch):
+        self._pending[:0] = batch
+
+class ActivityTracker(WriteBehindBuffer):
+    """Debounces users.last_activity.
+    
+    Activity is kept in memory, latest timestamp per user, and written once
+    per flush_interval, so each user costs at most one write per interval
+    however many updates they send.
+    """
+    
+    def __init__(self, db, flush_interval=None):
+        super().__init__(db, flush_interval or Config.ACTIVITY_FLUSH_INTERVAL)
+        self._last_seen = {}
+    
+    def touch(self, user_id):
+        """Record that a user was active just now"""
+        self._last_seen[user_id] = utc_timestamp()
+    
+    def _take_batch(self):
+        batch, self._last_seen = self._last_seen, {}
+        return batch
+    
+    async def _write(self, batch):
+        await self.db.update_last_activity(
+            [(last_activity, user_id) for user_id, last_activity in batch.items()]
+        )
+    
+    def _restore(self, batch):
+        # Activity seen since the failed flush is newer; keep it
+        for user_id, last_activity in batch.items():
+            self._last_seen.setdefault(user_id, last_activity)